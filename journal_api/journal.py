@@ -1,11 +1,13 @@
 """
 Endpoints for journal management.
 """
+import io
+import os
 from http import HTTPStatus
 
 from urllib.parse import unquote
 
-from flask import request, send_file, make_response
+from flask import request, send_file, make_response, Response
 from flask_restx import Namespace, Resource, fields
 
 import werkzeug.exceptions as wz
@@ -41,12 +43,18 @@ from backendcore.users.query import fetch_id_by_auth_key
 from journal_common.constants import (
     MASTHEAD,
 )
+import journal_common.etags as etg
+import journal_common.lru as lru
+import journal_common.render as rnd
 import manuscripts.core.fields as mflds
 import manuscripts.core.add_form as mafrm
+import manuscripts.core.convert as mcnv
 import manuscripts.core.query as mqry
 import manuscripts.core.dashboard as mdsh
+import manuscripts.core.history as mhist
 import people.fields as pflds
 import people.form as pfrm
+import people.importer as pimp
 import people.query as pqry
 import people.roles as rls
 import text.fields as tflds
@@ -81,21 +89,148 @@ DASHCOLUMNS = 'dashcolumns'
 PROTOCOL_NM = sm.fetch_journal_protocol_name()
 
 
+# Resolving an auth key to a user id is a backing-store lookup, and an
+# active dashboard does it many times a second, so we keep recent answers.
+# Only successful lookups are cached, and entries expire. Keys are issued
+# and revoked outside this service, so a revoked key stops working within
+# AUTH_CACHE_TTL seconds. When we change or delete a person, we forget
+# their entries at once with `revoke_user()`.
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 4096))
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', 300))
+
+auth_cache = lru.TTLCache(max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+
+def _fetch_id_by_auth_key(auth_key):
+    if not auth_key:
+        return fetch_id_by_auth_key(auth_key)
+    user_id = auth_cache.get(auth_key)
+    if user_id is None:
+        user_id = fetch_id_by_auth_key(auth_key)
+        if user_id:
+            auth_cache.put(auth_key, user_id)
+    return user_id
+
+
+# Permission decisions are cached the same way, for a shorter time.
+# The auth key is part of the key since the user id may come from the
+# request body, and the people roles generation is too, so any change to
+# people's roles makes every earlier decision miss.
+PERM_CACHE_SIZE = int(os.getenv('PERM_CACHE_SIZE', 4096))
+PERM_CACHE_TTL = float(os.getenv('PERM_CACHE_TTL', 30))
+
+perm_cache = lru.TTLCache(max_size=PERM_CACHE_SIZE, ttl=PERM_CACHE_TTL)
+
+# Where the user id sits in a permission cache key:
+PERM_USER_ID = 2
+
+
+def _is_permitted(action: str, user_id, auth_key) -> bool:
+    key = (PROTOCOL_NM, action, user_id, auth_key,
+           pqry.get_roles_generation())
+    permitted = perm_cache.get(key)
+    if permitted is None:
+        permitted = bool(sm.is_permitted(PROTOCOL_NM, action,
+                                         user_id=user_id,
+                                         auth_key=auth_key))
+        perm_cache.put(key, permitted)
+    return permitted
+
+
+def _get_permissions(actions: list, user_id, auth_key) -> dict:
+    """
+    Returns {action: whether `user_id` may take it} for all of `actions`.
+    """
+    return {action: _is_permitted(action, user_id, auth_key)
+            for action in actions}
+
+
+def revoke_user(user_id):
+    """
+    Forgets every cached auth key and permission belonging to `user_id`.
+    """
+    auth_cache.invalidate_if(lambda auth_key, cached_id: cached_id == user_id)
+    perm_cache.invalidate_if(lambda key, permitted:
+                             key[PERM_USER_ID] == user_id)
+
+
+def get_auth_cache_stats() -> dict:
+    return auth_cache.get_stats()
+
+
+def get_perm_cache_stats() -> dict:
+    return perm_cache.get_stats()
+
+
 def _get_user_info(request):
     user_id = None
     if request.is_json:
         user_id = request.json.get(EDITOR)
     auth_key = acmn.get_auth_key_from_request(request)
     if not user_id:
-        user_id = fetch_id_by_auth_key(auth_key)
+        user_id = _fetch_id_by_auth_key(auth_key)
     return user_id, auth_key
 
 
+JSON_MIMETYPE = 'application/json'
+
+
+def _json_response(data: bytes, etag: str, max_age: int = None):
+    """
+    Serves JSON we serialized ahead of time, with a strong ETag.
+    If the client's If-None-Match matches, we answer 304 with no body.
+    With no `max_age`, clients must revalidate every time.
+    """
+    response = Response(data, mimetype=JSON_MIMETYPE)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+
+# Fields, forms and choices only change when we deploy, so we serialize
+# them once, here, and let clients keep them for a good while.
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 24 * 60 * 60))
+
+
+def _static_response(payload: tuple):
+    return _json_response(*payload, max_age=STATIC_MAX_AGE)
+
+
+#############
+# Permissions
+#############
+
+PERMISSIONS = 'permissions'
+PERMISSION_ACTIONS = [sm.CREATE, sm.UPDATE, sm.DELETE]
+
+
+@api.route(f'/{PERMISSIONS}')
+@api.expect(parser)
+class Permissions(Resource):
+    """
+    Says which changes the user may make, so a client can show only the
+    controls that will work.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    def get(self):
+        """
+        Returns {action: whether the user may take it}.
+        """
+        user_id, auth_key = _get_user_info(request)
+        return {PERMISSIONS: _get_permissions(PERMISSION_ACTIONS, user_id,
+                                              auth_key)}
+
+
 #############
 # Text
 #############
 
 JOURNAL_TEXT_FIELDS = 'Journal text fields'
+TEXT_FIELDS_PAYLOAD = etg.serialize({JOURNAL_TEXT_FIELDS: tflds.get_flds()})
 
 
 @api.route(f'/{TEXT}/{FIELDS}')
@@ -107,10 +242,11 @@ class TextFields(Resource):
         """
         Get the journal text fields.
         """
-        return {JOURNAL_TEXT_FIELDS: tflds.get_flds()}
+        return _static_response(TEXT_FIELDS_PAYLOAD)
 
 
 JOURNAL_TEXT_FORM = 'Journal text add/query/update form'
+TEXT_FORM_PAYLOAD = etg.serialize({JOURNAL_TEXT_FORM: tform.get_form()})
 
 
 @api.route(f'/{TEXT}/{FORM}')
@@ -122,7 +258,7 @@ class TextForm(Resource):
         """
         Get the form for querying the journal text data.
         """
-        return {JOURNAL_TEXT_FORM: tform.get_form()}
+        return _static_response(TEXT_FORM_PAYLOAD)
 
 
 JOURNAL_TEXT_READ = 'Journal text map'
@@ -139,10 +275,30 @@ class TextRead(Resource):
         """
         Returns journal text data.
         """
-        texts = tqry.fetch_dict()
+        texts = {title: rnd.add_html(text, tflds.get_flds())
+                 for title, text in tqry.fetch_dict().items()}
         return {JOURNAL_TEXT_READ: texts}
 
 
+@api.route(f'/{TEXT}/{READ}/<title>')
+class TextReadOne(Resource):
+    """
+    This endpoint serves a single journal text.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_MODIFIED, 'Text unchanged')
+    @api.response(HTTPStatus.NOT_FOUND, 'Data not found')
+    def get(self, title):
+        """
+        Returns the journal text with this title.
+        """
+        try:
+            data, etag = tqry.get_text_payload(title)
+        except ValueError as e:
+            raise wz.NotFound(f'{str(e)}')
+        return _json_response(data, etag)
+
+
 UPDATE_TEXT_FLDS = api.model('UpdateText', {
     TEXT: fields.String,
     EDITOR: fields.String,
@@ -161,8 +317,7 @@ class TextUpdate(Resource):
         if not text:
             raise wz.NotAcceptable('You must pass text to update.')
         editor, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.UPDATE, user_id=editor,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.UPDATE, editor, auth_key):
             raise wz.Forbidden('Action not permitted.')
         try:
             tqry.update(title, text, editor)
@@ -180,8 +335,7 @@ class TextDelete(Resource):
     @api.expect(api.model('Placeholder', {}))
     def delete(self, title):
         editor, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.DELETE, user_id=editor,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.DELETE, editor, auth_key):
             raise wz.Forbidden('Action not permitted.')
         try:
             tqry.delete(title)
@@ -195,6 +349,7 @@ class TextDelete(Resource):
 #############
 
 JOURNAL_MANU_FIELDS = 'Journal manuscript fields'
+MANU_FIELDS_PAYLOAD = etg.serialize({JOURNAL_MANU_FIELDS: mflds.get_flds()})
 
 
 @api.route(f'/{MANU}/{FIELDS}')
@@ -206,10 +361,12 @@ class ManuFields(Resource):
         """
         Get the journal manuscript fields
         """
-        return {JOURNAL_MANU_FIELDS: mflds.get_flds()}
+        return _static_response(MANU_FIELDS_PAYLOAD)
 
 
 JOURNAL_MANU_CREATE_FORM = 'Journal manuscript form'
+MANU_CREATE_FORM_PAYLOAD = etg.serialize(
+    {JOURNAL_MANU_CREATE_FORM: mafrm.get_form()})
 
 
 @api.route(f'/{MANU}/{CREATE}/{FORM}')
@@ -221,7 +378,7 @@ class ManuCreateForm(Resource):
         """
         Get the form for adding the journal manuscript data.
         """
-        return {JOURNAL_MANU_CREATE_FORM: mafrm.get_form()}
+        return _static_response(MANU_CREATE_FORM_PAYLOAD)
 
 
 JOURNAL_MANU_READ = 'Journal manuscript map'
@@ -243,8 +400,8 @@ class ManuRead(Resource):
             user_id, auth_key = _get_user_info(request)
         except Exception as err:
             raise wz.Forbidden(f'Action not permitted: {err}')
-        manuscripts = mqry.fetch_manuscripts(user_id)
-        return {JOURNAL_MANU_READ: manuscripts}
+        # Abstracts are rendered when written, so nothing is rendered here.
+        return {JOURNAL_MANU_READ: mqry.fetch_manuscripts(user_id)}
 
 
 MANU_AUTHORS_NESTED = api.model('JournalManuAddAuthorsNested', {
@@ -280,10 +437,15 @@ class ManuCreate(Resource):
         return {MANU_ID: ret}
 
 
+CONVERT_JOB_ID = 'job id'
+OCTET_STREAM = 'application/octet-stream'
+FILENAME = 'filename'
+
 file_parser = api.parser()
 file_parser.add_argument(mafrm.MANU_FILE,
                          type=werkzeug.datastructures.FileStorage,
                          location='files')
+file_parser.add_argument(FILENAME, location='args')
 
 
 @api.route(f'/{MANU}/{ADD_FILE}/<manu_id>')
@@ -293,15 +455,55 @@ class ManuAddFile(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'File too large')
+    @api.response(HTTPStatus.SERVICE_UNAVAILABLE, 'Too many conversions')
     @api.expect(file_parser)
     def put(self, manu_id):
+        """
+        Uploads a file. It is converted in the background: poll the
+        returned job id for the conversion's status.
+        The file may come as a multipart form, or as the raw request body
+        (application/octet-stream) with its name in the `filename` arg,
+        which we stream straight to disk.
+        """
         try:
-            files = request.files
-            mqry.add_file(manu_id, files.to_dict())
+            mqry.check_upload_size(request.content_length)
+            if request.mimetype == OCTET_STREAM:
+                job_id = mqry.add_file_stream(manu_id, request.stream,
+                                              request.args.get(FILENAME))
+            else:
+                files = request.files
+                job_id = mqry.add_file(manu_id, files.to_dict())
+        except mqry.UploadTooLarge as err:
+            raise wz.RequestEntityTooLarge(f'{str(err)}')
+        except mcnv.ConversionBusy as err:
+            raise wz.ServiceUnavailable(f'{str(err)}')
         except Exception as err:
             print(err)
             raise wz.NotAcceptable(f'Manuscript creation error: {err}')
-        return {MESSAGE: 'File added!'}
+        return {MESSAGE: 'File added!', CONVERT_JOB_ID: job_id}
+
+
+JOB_STATUS = 'status'
+JOURNAL_CONVERT_JOB = 'Conversion job'
+
+
+@api.route(f'/{MANU}/{FILE}/{JOB_STATUS}/<job_id>')
+class ManuFileStatus(Resource):
+    """
+    This endpoint reports on a file conversion started by an upload.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_FOUND, 'Data not found')
+    def get(self, job_id):
+        """
+        Returns the conversion job's status: pending, done or failed.
+        """
+        try:
+            job = mcnv.fetch_status(job_id)
+        except ValueError as err:
+            raise wz.NotFound(f'{str(err)}')
+        return {JOURNAL_CONVERT_JOB: job}
 
 
 NEW_STATE = 'New state'
@@ -311,6 +513,7 @@ RECEIVE_ACTION = 'receive_action'
 RECEIVE_ACTION_FLDS = api.model('ReceiveAction', {
     ACTION: fields.String,
     EDITOR: fields.String,
+    mflds.VERSION: fields.Integer,
 })
 
 
@@ -320,6 +523,7 @@ class ManuReceiveAction(Resource):
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_FOUND, 'Entry not found')
     @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.response(HTTPStatus.CONFLICT, 'Manuscript changed by someone else')
     @api.expect(RECEIVE_ACTION_FLDS)
     def put(self, manu_id):
         action = request.json.get(ACTION)
@@ -329,22 +533,80 @@ class ManuReceiveAction(Resource):
         if not editor:
             raise wz.NotAcceptable('You must pass an editor.')
         user_id, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.UPDATE, user_id=editor,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.UPDATE, editor, auth_key):
             raise wz.Forbidden('Action not permitted.')
 
         referee = request.json.get(mqry.REFEREE_ARG)
         state = request.json.get(mqry.STATE)
+        version = request.json.get(mflds.VERSION)
         try:
             new_state = mqry.receive_action(manu_id, action, user_id,
+                                            version=version,
                                             **{EDITOR: editor,
                                                mqry.REFEREE_ARG: referee,
                                                mqry.STATE: state})
+        except mqry.VersionConflict as e:
+            raise wz.Conflict(f'{str(e)}')
         except ValueError as e:
             raise wz.NotFound(f'{str(e)}')
         return {NEW_STATE: new_state}
 
 
+RECEIVE_ACTIONS = 'receive_actions'
+ACTION_RESULTS = 'results'
+
+ACTION_REQ_FLDS = api.model('ActionRequest', {
+    mqry.MANU_ID: fields.String,
+    ACTION: fields.String,
+    mflds.VERSION: fields.Integer,
+    mqry.KWARGS: fields.Raw,
+})
+
+RECEIVE_ACTIONS_FLDS = api.model('ReceiveActions', {
+    EDITOR: fields.String,
+    mqry.ACTIONS: fields.List(fields.Nested(ACTION_REQ_FLDS)),
+})
+
+
+@api.route(f'/{MANU}/{RECEIVE_ACTIONS}')
+@api.expect(parser)
+class ManuReceiveActions(Resource):
+    """
+    Applies one or more actions to many manuscripts in one request.
+    Each action gets its own result, with either the new state or an error.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.expect(RECEIVE_ACTIONS_FLDS)
+    def put(self):
+        action_reqs = request.json.get(mqry.ACTIONS)
+        if not action_reqs or not isinstance(action_reqs, list):
+            raise wz.NotAcceptable('You must pass a list of actions.')
+        editor = request.json.get(EDITOR)
+        if not editor:
+            raise wz.NotAcceptable('You must pass an editor.')
+        user_id, auth_key = _get_user_info(request)
+        if not _is_permitted(sm.UPDATE, editor, auth_key):
+            raise wz.Forbidden('Action not permitted.')
+        for action_req in action_reqs:
+            if not isinstance(action_req, dict):
+                raise wz.NotAcceptable(f'Bad action request: {action_req}')
+            kwargs = action_req.get(mqry.KWARGS) or {}
+            if not isinstance(kwargs, dict):
+                raise wz.NotAcceptable(f'Bad action kwargs: {kwargs}')
+            # Only the args ManuReceiveAction takes get through.
+            action_req[mqry.KWARGS] = {
+                EDITOR: editor,
+                mqry.REFEREE_ARG: kwargs.get(mqry.REFEREE_ARG),
+                mqry.STATE: kwargs.get(mqry.STATE),
+            }
+        try:
+            results = mqry.receive_actions(action_reqs, user_id)
+        except ValueError as e:
+            raise wz.NotAcceptable(f'{str(e)}')
+        return {ACTION_RESULTS: results}
+
+
 @api.route(f'/{MANU}/{DELETE}/<manu_id>')
 @api.expect(parser)
 class ManuDelete(Resource):
@@ -354,8 +616,7 @@ class ManuDelete(Resource):
     @api.expect(api.model('Placeholder', {}))
     def put(self,  manu_id):
         user_id, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.UPDATE, user_id=user_id,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.UPDATE, user_id, auth_key):
             raise wz.Forbidden('Action not permitted.')
         try:
             mqry.delete(manu_id)
@@ -365,7 +626,47 @@ class ManuDelete(Resource):
             raise wz.NotFound(f'Person not found: {manu_id}')
 
 
+JOURNAL_MANU_HISTORY = 'Journal manuscript history'
+HISTORY = 'history'
+
+
+@api.route(f'/{MANU}/{HISTORY}/{READ}/<manu_id>')
+@api.expect(parser)
+class ManuHistoryRead(Resource):
+    """
+    This endpoint serves a manuscript's history a page at a time,
+    newest entries first.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_FOUND, 'Data not found')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.doc(params={mhist.OFFSET: 'Entries to skip',
+                     mhist.LIMIT: 'Entries per page'})
+    def get(self, manu_id):
+        """
+        Returns a page of a manuscript's history.
+        """
+        try:
+            user_id, auth_key = _get_user_info(request)
+        except Exception as err:
+            raise wz.Forbidden(f'Action not permitted: {err}')
+        args = acmn.get_args_from_req(request)
+        try:
+            offset = int(args.get(mhist.OFFSET, 0))
+            limit = int(args.get(mhist.LIMIT, mhist.DEF_PAGE_LEN))
+        except (TypeError, ValueError):
+            raise wz.NotAcceptable('Offset and limit must be integers.')
+        try:
+            history = mqry.fetch_history(manu_id, user_id, offset=offset,
+                                         limit=limit)
+        except ValueError as e:
+            raise wz.NotFound(f'{str(e)}')
+        return {JOURNAL_MANU_HISTORY: history}
+
+
 JOURNAL_MANU_STATES_READ = 'Journal manuscript states choices map'
+MANU_STATES_PAYLOAD = etg.serialize(
+    {JOURNAL_MANU_STATES_READ: get_state_choices()})
 
 
 @api.route(f'/{MANU}/{STATE}/{READ}')
@@ -379,10 +680,12 @@ class ManuStatesRead(Resource):
         """
         Returns journal manuscript state data.
         """
-        return {JOURNAL_MANU_STATES_READ: get_state_choices()}
+        return _static_response(MANU_STATES_PAYLOAD)
 
 
 JOURNAL_MANU_ACTIONS_READ = 'Journal manuscript action choices map'
+MANU_ACTIONS_PAYLOAD = etg.serialize(
+    {JOURNAL_MANU_ACTIONS_READ: get_action_choices()})
 
 
 @api.route(f'/{MANU}/{ACTION}/{READ}')
@@ -396,7 +699,7 @@ class ManuActionsRead(Resource):
         """
         Returns journal manuscript action data.
         """
-        return {JOURNAL_MANU_ACTIONS_READ: get_action_choices()}
+        return _static_response(MANU_ACTIONS_PAYLOAD)
 
 
 JOURNAL_MANU_FETCH_STATE = 'Fetch journal manuscript by state'
@@ -418,6 +721,9 @@ class ManuStateFetch(Resource):
 
 JOURNAL_MANU_COLUMNS_READ = "map"
 JOURNAL_MANU_COLUMNS_ORDER = "order"
+DASH_COLUMNS_PAYLOAD = etg.serialize(
+    {JOURNAL_MANU_COLUMNS_READ: mdsh.get_choices(),
+     JOURNAL_MANU_COLUMNS_ORDER: mdsh.get_choices_order()})
 
 
 @api.route(f'/{MANU}/{DASHCOLUMNS}/{READ}')
@@ -432,8 +738,7 @@ class DashColumnsRead(Resource):
         """
         Returns journal manuscript dashboard columns data.
         """
-        return {JOURNAL_MANU_COLUMNS_READ: mdsh.get_choices(),
-                JOURNAL_MANU_COLUMNS_ORDER: mdsh.get_choices_order()}
+        return _static_response(DASH_COLUMNS_PAYLOAD)
 
 
 @api.route(f'/{MANU}/{FILE}/{RETRIEVE}/<manu_id>')
@@ -445,7 +750,10 @@ class ManuFetchFile(Resource):
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_FOUND, 'Data not found')
     def get(self, manu_id):
-        filepath = mqry.get_original_submission_filename(manu_id)
+        try:
+            filepath = mqry.get_original_submission_filename(manu_id)
+        except ValueError as e:
+            raise wz.NotFound(f'{str(e)}')
         if len(filepath) < 1:
             return ''
         response = make_response(send_file(filepath, as_attachment=True))
@@ -460,6 +768,7 @@ class ManuFetchFile(Resource):
 
 PEOPLE = 'people'
 PEOPLE_FIELDS = 'People fields'
+PEOPLE_FIELDS_PAYLOAD = etg.serialize({PEOPLE_FIELDS: pflds.get_flds()})
 
 
 @api.route(f'/{PEOPLE}/{FIELDS}')
@@ -471,10 +780,11 @@ class PeopleFields(Resource):
         """
         Get the People fields.
         """
-        return {PEOPLE_FIELDS: pflds.get_flds()}
+        return _static_response(PEOPLE_FIELDS_PAYLOAD)
 
 
 PEOPLE_FORM = 'People query form'
+PEOPLE_FORM_PAYLOAD = etg.serialize({PEOPLE_FORM: pfrm.get_form()})
 
 
 @api.route(f'/{PEOPLE}/{FORM}')
@@ -486,17 +796,29 @@ class PeopleForm(Resource):
         """
         Get the form for querying the People data.
         """
-        return {PEOPLE_FORM: pfrm.get_form()}
+        return _static_response(PEOPLE_FORM_PAYLOAD)
+
+
+PEOPLE_SEARCH = 'search'
+PEOPLE_LIMIT = 'limit'
+MAX_PEOPLE_LIMIT = 100
 
 
 @api.route(f'/{PEOPLE}/{READ}')
 class PeopleRead(Resource):
     """
     This endpoint serves People data as a dict.
+    Passing `search` finds people by partial name, affiliation or position,
+    best match first, up to `limit` of them.
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_FOUND, 'Data not found')
-    @api.doc(params=pfrm.get_form_descr())
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.doc(params={
+        **pfrm.get_form_descr(),
+        PEOPLE_SEARCH: 'Partial name, affiliation or position to search for',
+        PEOPLE_LIMIT: 'Most search results to return',
+    })
     def get(self):
         """
         Returns People data.
@@ -505,10 +827,21 @@ class PeopleRead(Resource):
         name = args.get(pflds.NAME)
         role = args.get(rls.ROLE)
         user_id = args.get(pflds.USER_ID)
+        search = args.get(PEOPLE_SEARCH)
         people = {}
         if user_id:
             people = pqry.fetch_by_id(user_id)
             return {PEOPLE: people}
+        if search:
+            try:
+                limit = int(args.get(PEOPLE_LIMIT, pqry.srch.DEF_LIMIT))
+            except (TypeError, ValueError):
+                raise wz.NotAcceptable('The limit must be an integer.')
+            if limit < 1 or limit > MAX_PEOPLE_LIMIT:
+                raise wz.NotAcceptable('The limit must be between 1 and '
+                                       f'{MAX_PEOPLE_LIMIT}.')
+            people = pqry.search(unquote(search), limit=limit)
+            return {PEOPLE: people}
         if name:
             name = unquote(args.get(pflds.NAME))
         people = pqry.fetch_all_or_some(name=name, role=role)
@@ -525,6 +858,8 @@ PEOPLE_CREATE_FLDS = api.model('AddNewPeopleEntry', {
 
 
 PEOPLE_CREATE_FORM = 'People Add Form'
+PEOPLE_ADD_FORM_PAYLOAD = etg.serialize(
+    {PEOPLE_CREATE_FORM: pfrm.get_add_form()})
 
 
 @api.route(f'/{PEOPLE}/{CREATE}/{FORM}')
@@ -533,7 +868,7 @@ class PeopleAddForm(Resource):
     Form to add a new person to the journal database.
     """
     def get(self):
-        return {PEOPLE_CREATE_FORM: pfrm.get_add_form()}
+        return _static_response(PEOPLE_ADD_FORM_PAYLOAD)
 
 
 @api.route(f'/{PEOPLE}/{CREATE}')
@@ -550,8 +885,7 @@ class PeopleCreate(Resource):
         Add a person.
         """
         user_id, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.CREATE, user_id=user_id,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.CREATE, user_id, auth_key):
             raise wz.Forbidden('Action not permitted.')
         try:
             ret = pqry.add(request.json)
@@ -564,6 +898,64 @@ class PeopleCreate(Resource):
         }
 
 
+PEOPLE_IMPORT = 'import'
+PEOPLE_IMPORT_FILE = 'file'
+PEOPLE_IMPORT_REPORT = 'report'
+PEOPLE_IMPORT_COUNTS = 'counts'
+PEOPLE_IMPORT_TRUNCATED = 'truncated'
+PEOPLE_IMPORT_ERROR = 'error'
+BATCH_SIZE = 'batch_size'
+
+import_parser = api.parser()
+import_parser.add_argument(AUTH, location='headers')
+import_parser.add_argument(PEOPLE_IMPORT_FILE,
+                           type=werkzeug.datastructures.FileStorage,
+                           location='files')
+import_parser.add_argument(BATCH_SIZE, type=int, location='args')
+
+
+@api.route(f'/{PEOPLE}/{PEOPLE_IMPORT}')
+class PeopleImport(Resource):
+    """
+    Adds many people at once from an uploaded CSV or JSON Lines file.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.expect(import_parser)
+    def put(self):
+        """
+        Import people: we return how many rows were added, duplicates or
+        invalid, and a report on the first rows that weren't added.
+        If the file can't be read past some row, we stop there, and return
+        the results for the rows before it along with the error.
+        """
+        user_id, auth_key = _get_user_info(request)
+        if not _is_permitted(sm.CREATE, user_id, auth_key):
+            raise wz.Forbidden('Action not permitted.')
+        upload = request.files.get(PEOPLE_IMPORT_FILE)
+        if not upload:
+            raise wz.NotAcceptable('You must upload a file.')
+        try:
+            batch_size = int(request.args.get(BATCH_SIZE,
+                                              pimp.DEF_BATCH_SIZE))
+            fmt = pimp.get_format(upload.filename or '')
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8',
+                                      newline='')
+            result = pimp.run_import(stream, fmt, batch_size=batch_size)
+        except ValueError as err:
+            raise wz.NotAcceptable(f'Could not import people: {err}')
+        ret = {
+            MESSAGE: 'People imported.',
+            PEOPLE_IMPORT_COUNTS: result[pimp.COUNTS],
+            PEOPLE_IMPORT_REPORT: result[pimp.REPORT],
+            PEOPLE_IMPORT_TRUNCATED: result[pimp.TRUNCATED],
+        }
+        if pimp.ERROR in result:
+            ret[MESSAGE] = 'People import stopped early.'
+            ret[PEOPLE_IMPORT_ERROR] = result[pimp.ERROR]
+        return ret
+
+
 @api.route(f'/{PEOPLE}/{DELETE}/<person_id>')
 @api.expect(parser)
 class PeopleDelete(Resource):
@@ -576,11 +968,12 @@ class PeopleDelete(Resource):
     @api.expect(api.model('Placeholder', {}))
     def delete(self, person_id):
         user_id, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.DELETE, user_id=user_id,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.DELETE, user_id, auth_key):
             raise wz.Forbidden('Action not permitted.')
         try:
+            person = pqry.fetch_by_key(person_id) or {}
             pqry.delete(person_id)
+            revoke_user(person.get(pflds.EMAIL))
             return {MESSAGE: 'Person deleted!'}
         except ValueError:
             print(f'Person not found: {person_id}.')
@@ -615,14 +1008,15 @@ class PeopleUpdate(Resource):
     @api.expect(PEOPLE_CREATE_FLDS)
     def put(self, person_id):
         user_id, auth_key = _get_user_info(request)
-        if not sm.is_permitted(PROTOCOL_NM, sm.UPDATE, user_id=user_id,
-                               auth_key=auth_key):
+        if not _is_permitted(sm.UPDATE, user_id, auth_key):
             raise wz.Forbidden('Action not permitted.')
         try:
+            person = pqry.fetch_by_key(person_id) or {}
             if not pqry.update(person_id, request.json):
                 raise wz.NotFound(f'{person_id=} not found for updating')
         except ValueError as e:
             raise wz.NotAcceptable(f'Error updating user: {e}')
+        revoke_user(person.get(pflds.EMAIL))
         return {MESSAGE: 'Person updated.'}
 
 
@@ -631,12 +1025,14 @@ class PeopleMasthead(Resource):
     """
     Get the journal's masthead.
     """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_MODIFIED, 'Masthead unchanged')
     def get(self):
         """
         Get the people data for the journal masthead.
         """
-        mast = pqry.get_masthead()
-        return {MASTHEAD: mast}
+        data, etag = pqry.get_masthead_payload()
+        return _json_response(data, etag)
 
 
 def main():
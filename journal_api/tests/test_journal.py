@@ -1,6 +1,14 @@
+import json
 from unittest.mock import patch
+from urllib.parse import quote
+
+import pytest
+from flask import Flask
+from flask_restx import Api
 
 import journal_api.journal as jrnl
+from people.tests.test_query import temp_person  # noqa: F401
+from text.tests.test_query import temp_text  # noqa: F401
 
 TEST_USER = 'test@test.com'
 TEST_AUTH_KEY = 'some_auth_key'
@@ -17,6 +25,26 @@ class Request():
 
 
 FAKE_REQUEST = Request({jrnl.EDITOR: TEST_USER})
+JOURNAL_URL = f'/{jrnl.JOURNAL}'
+
+
+@pytest.fixture(scope='module')
+def client():
+    app = Flask(__name__)
+    Api(app).add_namespace(jrnl.api)
+    return app.test_client()
+
+
+@pytest.fixture(scope='function')
+def permitted():
+    """
+    Lets the request through as TEST_USER.
+    """
+    with patch('journal_api.journal._get_user_info', autospec=True,
+               return_value=(TEST_USER, TEST_AUTH_KEY)), \
+            patch('journal_api.journal._is_permitted', autospec=True,
+                  return_value=True):
+        yield
 
 
 @patch('backendcore.api.common.get_auth_key_from_request',
@@ -25,3 +53,196 @@ def test_get_user_info(mock_auth_key):
     user_id, auth_key = jrnl._get_user_info(FAKE_REQUEST)
     assert user_id == TEST_USER
     assert auth_key == TEST_AUTH_KEY
+
+
+FAKE_USER_ID = 'some_user_id'
+
+
+@patch('journal_api.journal.fetch_id_by_auth_key',
+       autospec=True, return_value=FAKE_USER_ID)
+def test_fetch_id_by_auth_key_cached(mock_fetch):
+    jrnl.auth_cache.clear()
+    assert jrnl._fetch_id_by_auth_key(TEST_AUTH_KEY) == FAKE_USER_ID
+    assert jrnl._fetch_id_by_auth_key(TEST_AUTH_KEY) == FAKE_USER_ID
+    assert mock_fetch.call_count == 1
+
+
+@patch('journal_api.journal.fetch_id_by_auth_key',
+       autospec=True, return_value=None)
+def test_fetch_id_by_auth_key_no_user_not_cached(mock_fetch):
+    jrnl.auth_cache.clear()
+    assert jrnl._fetch_id_by_auth_key(TEST_AUTH_KEY) is None
+    jrnl._fetch_id_by_auth_key(TEST_AUTH_KEY)
+    assert mock_fetch.call_count == 2
+
+
+@patch('journal_api.journal.fetch_id_by_auth_key',
+       autospec=True, return_value=FAKE_USER_ID)
+def test_revoke_user(mock_fetch):
+    jrnl.auth_cache.clear()
+    jrnl._fetch_id_by_auth_key(TEST_AUTH_KEY)
+    jrnl.revoke_user(FAKE_USER_ID)
+    assert len(jrnl.auth_cache) == 0
+
+
+@patch('backendcore.security.sec_manager2.is_permitted',
+       autospec=True, return_value=True)
+def test_is_permitted_cached(mock_perm):
+    jrnl.perm_cache.clear()
+    assert jrnl._is_permitted(jrnl.sm.UPDATE, TEST_USER, TEST_AUTH_KEY)
+    assert jrnl._is_permitted(jrnl.sm.UPDATE, TEST_USER, TEST_AUTH_KEY)
+    assert mock_perm.call_count == 1
+
+
+@patch('backendcore.security.sec_manager2.is_permitted',
+       autospec=True, return_value=False)
+def test_is_permitted_keyed_on_auth_key(mock_perm):
+    jrnl.perm_cache.clear()
+    assert not jrnl._is_permitted(jrnl.sm.UPDATE, TEST_USER, TEST_AUTH_KEY)
+    jrnl._is_permitted(jrnl.sm.UPDATE, TEST_USER, 'another_auth_key')
+    assert mock_perm.call_count == 2
+
+
+@patch('backendcore.security.sec_manager2.is_permitted',
+       autospec=True, return_value=True)
+def test_is_permitted_roles_change(mock_perm):
+    jrnl.perm_cache.clear()
+    jrnl._is_permitted(jrnl.sm.DELETE, TEST_USER, TEST_AUTH_KEY)
+    with patch('people.query.get_roles_generation', autospec=True,
+               return_value=jrnl.pqry.get_roles_generation() + 1):
+        jrnl._is_permitted(jrnl.sm.DELETE, TEST_USER, TEST_AUTH_KEY)
+    assert mock_perm.call_count == 2
+
+
+@patch('backendcore.security.sec_manager2.is_permitted',
+       autospec=True, return_value=True)
+def test_get_permissions(mock_perm):
+    jrnl.perm_cache.clear()
+    actions = [jrnl.sm.CREATE, jrnl.sm.UPDATE, jrnl.sm.DELETE]
+    perms = jrnl._get_permissions(actions, TEST_USER, TEST_AUTH_KEY)
+    assert perms == {action: True for action in actions}
+    jrnl._get_permissions(actions, TEST_USER, TEST_AUTH_KEY)
+    assert mock_perm.call_count == len(actions)
+
+
+@patch('backendcore.security.sec_manager2.is_permitted',
+       autospec=True, return_value=True)
+def test_revoke_user_forgets_permissions(mock_perm):
+    jrnl.perm_cache.clear()
+    jrnl._is_permitted(jrnl.sm.UPDATE, TEST_USER, TEST_AUTH_KEY)
+    jrnl.revoke_user(TEST_USER)
+    assert len(jrnl.perm_cache) == 0
+
+
+def test_static_payloads():
+    data, etag = jrnl.PEOPLE_FIELDS_PAYLOAD
+    assert json.loads(data) == {jrnl.PEOPLE_FIELDS: jrnl.pflds.get_flds()}
+    assert etag == jrnl.etg.make_etag(data)
+
+
+@patch('journal_api.journal.revoke_user', autospec=True)
+@patch('people.query.delete', autospec=True, return_value=True)
+@patch('people.query.fetch_by_key', autospec=True,
+       return_value={jrnl.pflds.EMAIL: FAKE_USER_ID})
+def test_people_delete_revokes_user(mock_fetch, mock_delete, mock_revoke,
+                                    client, permitted):
+    resp = client.delete(f'{JOURNAL_URL}/{jrnl.PEOPLE}/{jrnl.DELETE}/some_id')
+    assert resp.status_code == 200
+    mock_revoke.assert_called_once_with(FAKE_USER_ID)
+
+
+@patch('journal_api.journal.revoke_user', autospec=True)
+@patch('people.query.update', autospec=True, return_value=True)
+@patch('people.query.fetch_by_key', autospec=True,
+       return_value={jrnl.pflds.EMAIL: FAKE_USER_ID})
+def test_people_update_revokes_user(mock_fetch, mock_update, mock_revoke,
+                                    client, permitted):
+    resp = client.put(f'{JOURNAL_URL}/{jrnl.PEOPLE}/{jrnl.UPDATE}/some_id',
+                      json={jrnl.pflds.NAME: 'New Name'})
+    assert resp.status_code == 200
+    mock_revoke.assert_called_once_with(FAKE_USER_ID)
+
+
+@patch('backendcore.security.sec_manager2.is_permitted', autospec=True,
+       side_effect=lambda protocol, action, **kwargs: action == jrnl.sm.UPDATE)
+@patch('journal_api.journal._get_user_info', autospec=True,
+       return_value=(TEST_USER, TEST_AUTH_KEY))
+def test_permissions_endpoint(mock_user_info, mock_perm, client):
+    jrnl.perm_cache.clear()
+    resp = client.get(f'{JOURNAL_URL}/{jrnl.PERMISSIONS}')
+    assert resp.status_code == 200
+    assert resp.get_json()[jrnl.PERMISSIONS] == {
+        jrnl.sm.CREATE: False,
+        jrnl.sm.UPDATE: True,
+        jrnl.sm.DELETE: False,
+    }
+
+
+MASTHEAD_URL = f'{JOURNAL_URL}/{jrnl.PEOPLE}/{jrnl.MASTHEAD}'
+
+
+def test_masthead_not_modified(client):
+    etag = client.get(MASTHEAD_URL).headers['ETag']
+    resp = client.get(MASTHEAD_URL, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_masthead_etag_changes_on_write(client, temp_person):  # noqa: F811
+    etag = client.get(MASTHEAD_URL).headers['ETag']
+    jrnl.pqry.update(temp_person, {**jrnl.pqry.TEST_PERSON,
+                                   jrnl.pflds.NAME: 'Someone Else'})
+    resp = client.get(MASTHEAD_URL, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+MANU_FIELDS_URL = f'{JOURNAL_URL}/{jrnl.MANU}/{jrnl.FIELDS}'
+MANU_STATES_URL = f'{JOURNAL_URL}/{jrnl.MANU}/{jrnl.STATE}/{jrnl.READ}'
+
+
+def test_manu_fields_not_modified(client):
+    resp = client.get(MANU_FIELDS_URL)
+    assert resp.status_code == 200
+    assert resp.headers['ETag'].strip('"') == jrnl.MANU_FIELDS_PAYLOAD[1]
+    assert resp.cache_control.max_age == jrnl.STATIC_MAX_AGE
+    resp = client.get(MANU_FIELDS_URL,
+                      headers={'If-None-Match': resp.headers['ETag']})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_manu_states_stale_etag(client):
+    """
+    Static payloads only change when we deploy, so an old ETag is all a
+    changed payload can look like.
+    """
+    resp = client.get(MANU_STATES_URL, headers={'If-None-Match': '"old"'})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != '"old"'
+
+
+TEXT_URL = (f'{JOURNAL_URL}/{jrnl.TEXT}/{jrnl.READ}/'
+            f'{quote(jrnl.tqry.TEST_TITLE)}')
+
+
+def test_text_read_one_not_modified(client, temp_text):  # noqa: F811
+    etag = client.get(TEXT_URL).headers['ETag']
+    resp = client.get(TEXT_URL, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_text_read_one_etag_changes_on_write(client,
+                                             temp_text):  # noqa: F811
+    etag = client.get(TEXT_URL).headers['ETag']
+    jrnl.tqry.update(jrnl.tqry.TEST_TITLE, 'Some new text.', TEST_USER)
+    resp = client.get(TEXT_URL, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    assert resp.get_json()[jrnl.TEXT] == 'Some new text.'
+
+
+def test_text_read_one_not_found(client):
+    resp = client.get(f'{JOURNAL_URL}/{jrnl.TEXT}/{jrnl.READ}/no-such-text')
+    assert resp.status_code == 404
@@ -0,0 +1,24 @@
+"""
+Helpers for payloads we serialize once and serve many times.
+Each payload is turned into JSON bytes, and its ETag is a hash of those
+bytes, so the ETag changes exactly when the content does.
+"""
+import hashlib
+import json
+
+
+def to_json_bytes(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def make_etag(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def serialize(payload) -> tuple:
+    """
+    Returns `payload` as JSON bytes along with their ETag.
+    """
+    data = to_json_bytes(payload)
+    return data, make_etag(data)
@@ -0,0 +1,74 @@
+"""
+A small, thread-safe LRU cache whose entries can also expire.
+Once the cache is full, adding an entry drops the least recently used
+one. With a `ttl` (in seconds), entries older than that are misses.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+HITS = 'hits'
+MISSES = 'misses'
+EVICTIONS = 'evictions'
+SIZE = 'size'
+
+DEF_MAX_SIZE = 1024
+
+
+class TTLCache:
+    def __init__(self, max_size: int = DEF_MAX_SIZE, ttl: float = None,
+                 clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError(f'Bad cache size: {max_size}')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.stats = {HITS: 0, MISSES: 0, EVICTIONS: 0}
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.stats[HITS] += 1
+                    return value
+                del self.entries[key]
+            self.stats[MISSES] += 1
+            return default
+
+    def put(self, key, value):
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats[EVICTIONS] += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_if(self, pred):
+        """
+        Drops every entry for which `pred(key, value)` is true.
+        """
+        with self.lock:
+            for key in [key for key, (value, expires) in self.entries.items()
+                        if pred(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {**self.stats, SIZE: len(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
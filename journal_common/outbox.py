@@ -0,0 +1,228 @@
+"""
+This is our outgoing email queue.
+Request handlers only enqueue a message: a small pool of background
+threads does the sending, retrying failures with exponential backoff.
+Messages are stored until sent, so pending mail survives a restart.
+A sender claims a message before sending it: the claim holds a lease, and
+only a message whose lease has run out may be claimed again, so a message
+a crashed sender was holding is retried, but nobody else's is. Our cache
+has no conditional writes, so a claim is only atomic among the senders of
+one process: run the senders in a single process, or a message may be
+sent twice.
+For tests, `use_local_sink()` keeps messages in a list instead of mailing.
+"""
+import os
+import queue
+import time
+from threading import Lock, Thread, Timer
+
+from backendcore.common.constants import OBJ_ID_NM
+from backendcore.data.caching import needs_cache, get_cache
+from backendcore.emailer.api_send import send_mail
+
+from journal_common.common import get_collect_name
+
+DB = 'journalDB'
+COLLECT = 'outbox'
+CACHE_NM = COLLECT
+
+# Message fields: the first five are what `send_mail()` takes.
+TO_EMAILS = 'to_emails'
+SUBJECT = 'subject'
+CONTENT = 'content'
+REPLY_EMAIL = 'reply_email'
+FILE = 'file'
+ATTEMPTS = 'attempts'
+LAST_ERROR = 'last_error'
+STATUS = 'status'
+LEASE_UNTIL = 'lease_until'
+
+MAIL_FLDS = [TO_EMAILS, SUBJECT, CONTENT, REPLY_EMAIL, FILE]
+
+# Message statuses:
+PENDING = 'pending'
+SENDING = 'sending'
+FAILED = 'failed'
+
+NUM_SENDERS = int(os.getenv('OUTBOX_SENDERS', 2))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+BASE_DELAY = float(os.getenv('OUTBOX_BASE_DELAY', 2))
+MAX_DELAY = float(os.getenv('OUTBOX_MAX_DELAY', 300))
+LEASE_SECS = float(os.getenv('OUTBOX_LEASE', 300))
+
+
+def needs_outbox_cache(fn):
+    """
+    Should be used to decorate any function that uses datacollection methods.
+    """
+    return needs_cache(fn, CACHE_NM, DB,
+                       get_collect_name(COLLECT),
+                       key_fld=OBJ_ID_NM,
+                       no_id=False)
+
+
+work_queue = queue.Queue()
+senders = []
+senders_lock = Lock()
+claim_lock = Lock()
+
+local_sink = None
+
+
+def use_local_sink(on: bool = True):
+    """
+    With the local sink on, messages are appended to `get_local_sink()`
+    rather than sent.
+    """
+    global local_sink
+    local_sink = [] if on else None
+
+
+def get_local_sink() -> list:
+    return local_sink
+
+
+@needs_outbox_cache
+def fetch_dict():
+    return get_cache(COLLECT).fetch_dict()
+
+
+@needs_outbox_cache
+def fetch_by_key(msg_id):
+    return get_cache(COLLECT).fetch_by_key(msg_id)
+
+
+@needs_outbox_cache
+def update(msg_id, update_dict):
+    return get_cache(COLLECT).update(msg_id, update_dict, by_id=True)
+
+
+@needs_outbox_cache
+def delete(msg_id):
+    return get_cache(COLLECT).delete(msg_id, by_id=True)
+
+
+@needs_outbox_cache
+def enqueue(to_emails, subject: str, content: str, reply_email: str = None,
+            file: str = None) -> str:
+    """
+    Stores a message and hands it to the senders. Returns the message id.
+    """
+    ensure_senders()
+    msg_id = get_cache(COLLECT).add({
+        TO_EMAILS: to_emails,
+        SUBJECT: subject,
+        CONTENT: content,
+        REPLY_EMAIL: reply_email,
+        FILE: file,
+        ATTEMPTS: 0,
+        STATUS: PENDING,
+    })
+    work_queue.put(msg_id)
+    return msg_id
+
+
+def deliver(msg: dict):
+    mail = {fld: msg.get(fld) for fld in MAIL_FLDS}
+    if local_sink is not None:
+        local_sink.append(mail)
+    else:
+        send_mail(**mail)
+
+
+def get_retry_delay(attempts: int) -> float:
+    return min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY)
+
+
+def is_claimable(msg: dict, now: float) -> bool:
+    if msg.get(STATUS) == PENDING:
+        return True
+    return msg.get(STATUS) == SENDING and msg.get(LEASE_UNTIL, 0) < now
+
+
+def claim(msg_id) -> dict:
+    """
+    Marks a message as being sent by us, for LEASE_SECS seconds.
+    Returns the message, or None if it is gone or another sender in this
+    process holds it.
+    """
+    with claim_lock:
+        msg = fetch_by_key(msg_id)
+        if not msg or not is_claimable(msg, time.time()):
+            return None
+        lease = {STATUS: SENDING, LEASE_UNTIL: time.time() + LEASE_SECS}
+        update(msg_id, lease)
+    return {**msg, **lease}
+
+
+def send_one(msg_id):
+    """
+    Tries to send one message: on success it leaves the outbox; on failure
+    it is retried later, until it has failed MAX_ATTEMPTS times.
+    """
+    msg = claim(msg_id)
+    if not msg:
+        return
+    try:
+        deliver(msg)
+    except Exception as err:
+        attempts = msg.get(ATTEMPTS, 0) + 1
+        status = PENDING if attempts < MAX_ATTEMPTS else FAILED
+        update(msg_id, {ATTEMPTS: attempts, LAST_ERROR: str(err),
+                        STATUS: status, LEASE_UNTIL: None})
+        if status == PENDING:
+            retry = Timer(get_retry_delay(attempts), work_queue.put,
+                          args=[msg_id])
+            retry.daemon = True
+            retry.start()
+        return
+    delete(msg_id)
+
+
+def run_sender():
+    while True:
+        msg_id = work_queue.get()
+        try:
+            send_one(msg_id)
+        except Exception as err:
+            print(f'Outbox could not process {msg_id}: {err}')
+        finally:
+            work_queue.task_done()
+
+
+def requeue_pending():
+    """
+    Puts every stored message we may claim back on the queue: for startup.
+    Messages another sender holds a live lease on are left alone.
+    """
+    now = time.time()
+    for msg_id, msg in fetch_dict().items():
+        if is_claimable(msg, now):
+            work_queue.put(msg_id)
+
+
+def ensure_senders():
+    with senders_lock:
+        if senders:
+            return
+        for i in range(NUM_SENDERS):
+            sender = Thread(target=run_sender, name=f'outbox-sender-{i}',
+                            daemon=True)
+            sender.start()
+            senders.append(sender)
+    requeue_pending()
+
+
+def flush():
+    """
+    Waits until everything queued so far has been tried once.
+    """
+    work_queue.join()
+
+
+def main():
+    print(f'{fetch_dict()=}')
+
+
+if __name__ == '__main__':
+    main()
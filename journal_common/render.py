@@ -0,0 +1,140 @@
+"""
+Renders our Markdown fields to HTML.
+Pandoc does the rendering, with raw HTML and attribute syntax turned off,
+and we then drop any link or image whose URL could run script, along with
+any event-handler attribute that got through.
+Rendering means starting pandoc, so results are kept in a bounded cache
+keyed on a hash of the source: a field is rendered again only when its
+content changes. Collections read in bulk should instead render when a
+field is written, with `render_flds()`, and store the HTML.
+"""
+import hashlib
+import html
+import os
+import re
+
+import pypandoc as pdc
+from markupsafe import escape
+
+import backendcore.data.fields as cflds
+
+import journal_common.lru as lru
+
+HTML_SUFFIX = '_html'
+
+# Pandoc Markdown, minus everything that lets an author write raw HTML
+# or set arbitrary attributes.
+MD_FORMAT = ('markdown'
+             '-raw_html'
+             '-raw_attribute'
+             '-native_divs'
+             '-native_spans'
+             '-link_attributes'
+             '-header_attributes'
+             '-fenced_code_attributes'
+             '-inline_code_attributes'
+             '-bracketed_spans'
+             '-fenced_divs')
+
+SAFE_SCHEMES = {'http', 'https', 'mailto'}
+SAFE_URL = '#'
+
+URL_ATTR_RE = re.compile(r'\b(href|src)="([^"]*)"', re.IGNORECASE)
+EVENT_ATTR_RE = re.compile(r'\son\w+="[^"]*"', re.IGNORECASE)
+SCHEME_RE = re.compile(r'^([a-z][a-z0-9+.-]*):')
+CONTROL_RE = re.compile(r'[\x00-\x20]')
+
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', 1024))
+
+render_cache = lru.TTLCache(max_size=RENDER_CACHE_SIZE)
+
+
+def html_fld(fld_nm: str) -> str:
+    return f'{fld_nm}{HTML_SUFFIX}'
+
+
+def get_markdown_flds(flds: dict) -> list:
+    return [fld_nm for fld_nm, fld in flds.items()
+            if fld.get(cflds.MARKDOWN)]
+
+
+def content_hash(source: str) -> str:
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def is_safe_url(url: str) -> bool:
+    """
+    Relative URLs are fine; absolute ones need a scheme we trust.
+    """
+    url = CONTROL_RE.sub('', html.unescape(url)).lower()
+    match = SCHEME_RE.match(url)
+    return match is None or match.group(1) in SAFE_SCHEMES
+
+
+def _safe_url_attr(match) -> str:
+    attr, url = match.groups()
+    if not is_safe_url(url):
+        url = SAFE_URL
+    return f'{attr}="{url}"'
+
+
+def sanitize(rendered: str) -> str:
+    rendered = EVENT_ATTR_RE.sub('', rendered)
+    return URL_ATTR_RE.sub(_safe_url_attr, rendered)
+
+
+def to_html(source: str) -> str:
+    return pdc.convert_text(source, 'html', format=MD_FORMAT)
+
+
+def render(source: str) -> str:
+    """
+    Returns `source` rendered to sanitized HTML.
+    If pandoc fails, we return the source escaped, and don't cache that.
+    """
+    key = content_hash(source)
+    rendered = render_cache.get(key)
+    if rendered is None:
+        try:
+            rendered = sanitize(to_html(source))
+        except (OSError, RuntimeError) as err:
+            print(f'Could not render Markdown: {err}')
+            return f'<pre>{escape(source)}</pre>'
+        render_cache.put(key, rendered)
+    return rendered
+
+
+def add_html(rec: dict, flds: dict) -> dict:
+    """
+    Returns a copy of `rec` with the HTML for each of its Markdown fields
+    next to the source, under the field name plus HTML_SUFFIX.
+    """
+    rec = dict(rec)
+    for fld_nm in get_markdown_flds(flds):
+        source = rec.get(fld_nm)
+        if isinstance(source, str):
+            rec[html_fld(fld_nm)] = render(source)
+    return rec
+
+
+def render_flds(data: dict, flds: dict) -> dict:
+    """
+    For writes: returns a copy of `data` with the HTML for each Markdown
+    field it sets. Any HTML fields passed in are dropped, since only we
+    may write those.
+    """
+    html_flds = {html_fld(fld_nm) for fld_nm in get_markdown_flds(flds)}
+    return add_html({fld_nm: val for fld_nm, val in data.items()
+                     if fld_nm not in html_flds}, flds)
+
+
+def get_render_stats() -> dict:
+    return render_cache.get_stats()
+
+
+def main():
+    print(render('Some *Markdown* with [a link](https://example.com).'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import json
+
+import journal_common.etags as etg
+
+TEST_PAYLOAD = {'masthead': {'Editor': [{'name': 'Élen'}]}}
+
+
+def test_to_json_bytes():
+    data = etg.to_json_bytes(TEST_PAYLOAD)
+    assert isinstance(data, bytes)
+    assert json.loads(data) == TEST_PAYLOAD
+
+
+def test_make_etag_stable():
+    data = etg.to_json_bytes(TEST_PAYLOAD)
+    assert etg.make_etag(data) == etg.make_etag(data)
+
+
+def test_make_etag_changes():
+    assert etg.make_etag(b'one') != etg.make_etag(b'two')
+
+
+def test_serialize():
+    data, etag = etg.serialize(TEST_PAYLOAD)
+    assert etag == etg.make_etag(data)
@@ -0,0 +1,91 @@
+import pytest
+
+import journal_common.lru as lru
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope='function')
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope='function')
+def cache(clock):
+    return lru.TTLCache(max_size=2, ttl=10, clock=clock)
+
+
+def test_get_put(cache):
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+
+
+def test_get_missing(cache):
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+
+
+def test_expiry(cache, clock):
+    cache.put('a', 1)
+    clock.now = 11
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_no_ttl(clock):
+    cache = lru.TTLCache(ttl=None, clock=clock)
+    cache.put('a', 1)
+    clock.now = 10 ** 9
+    assert cache.get('a') == 1
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get_stats()[lru.EVICTIONS] == 1
+
+
+def test_invalidate(cache):
+    cache.put('a', 1)
+    cache.invalidate('a')
+    cache.invalidate('not there')
+    assert cache.get('a') is None
+
+
+def test_invalidate_if(cache):
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.invalidate_if(lambda key, value: value == 2)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+
+def test_clear(cache):
+    cache.put('a', 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_stats(cache):
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('b')
+    stats = cache.get_stats()
+    assert stats[lru.HITS] == 1
+    assert stats[lru.MISSES] == 1
+    assert stats[lru.SIZE] == 1
+
+
+def test_bad_size():
+    with pytest.raises(ValueError):
+        lru.TTLCache(max_size=0)
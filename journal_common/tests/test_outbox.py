@@ -0,0 +1,85 @@
+import queue
+import time
+from unittest.mock import patch
+
+import pytest
+
+import journal_common.outbox as obx
+
+TEST_EMAIL = 'someone@example.com'
+TEST_SUBJECT = 'A test message'
+TEST_CONTENT = 'Nothing to see here.'
+
+
+@pytest.fixture(scope='function')
+def local_sink():
+    obx.use_local_sink()
+    yield obx.get_local_sink()
+    obx.use_local_sink(False)
+
+
+@pytest.fixture(scope='function')
+def stored_msg():
+    """
+    A stored message that no sender will pick up.
+    """
+    with patch.object(obx, 'ensure_senders', autospec=True), \
+            patch.object(obx, 'work_queue', queue.Queue()):
+        msg_id = obx.enqueue(TEST_EMAIL, TEST_SUBJECT, TEST_CONTENT)
+        yield msg_id
+    obx.delete(msg_id)
+
+
+def test_enqueue_and_send(local_sink):
+    msg_id = obx.enqueue(TEST_EMAIL, TEST_SUBJECT, TEST_CONTENT)
+    assert msg_id
+    obx.flush()
+    assert local_sink[-1][obx.TO_EMAILS] == TEST_EMAIL
+    assert local_sink[-1][obx.SUBJECT] == TEST_SUBJECT
+    assert obx.fetch_by_key(msg_id) is None
+
+
+@patch('journal_common.outbox.deliver', side_effect=RuntimeError('down'),
+       autospec=True)
+@patch('journal_common.outbox.get_retry_delay', return_value=3600,
+       autospec=True)
+def test_send_failure_kept_for_retry(mock_delay, mock_deliver):
+    msg_id = obx.enqueue(TEST_EMAIL, TEST_SUBJECT, TEST_CONTENT)
+    obx.flush()
+    msg = obx.fetch_by_key(msg_id)
+    assert msg[obx.ATTEMPTS] == 1
+    assert msg[obx.STATUS] == obx.PENDING
+    obx.delete(msg_id)
+
+
+def test_get_retry_delay():
+    assert obx.get_retry_delay(1) == obx.BASE_DELAY
+    assert obx.get_retry_delay(2) == 2 * obx.BASE_DELAY
+    assert obx.get_retry_delay(100) == obx.MAX_DELAY
+
+
+def test_claim_once(stored_msg):
+    assert obx.claim(stored_msg)[obx.STATUS] == obx.SENDING
+    assert obx.claim(stored_msg) is None
+
+
+def test_claim_expired_lease(stored_msg):
+    obx.claim(stored_msg)
+    obx.update(stored_msg, {obx.LEASE_UNTIL: time.time() - 1})
+    assert obx.claim(stored_msg)
+
+
+def test_send_one_claimed_elsewhere(stored_msg, local_sink):
+    obx.claim(stored_msg)
+    obx.send_one(stored_msg)
+    assert local_sink == []
+    assert obx.fetch_by_key(stored_msg)
+
+
+def test_requeue_pending_skips_leased(stored_msg):
+    obx.claim(stored_msg)
+    obx.requeue_pending()
+    assert stored_msg not in obx.work_queue.queue
+    obx.update(stored_msg, {obx.LEASE_UNTIL: time.time() - 1})
+    obx.requeue_pending()
+    assert stored_msg in obx.work_queue.queue
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+import pytest
+
+import journal_common.render as rnd
+
+SOURCE = 'Some *Markdown*.'
+RENDERED = '<p>Some <em>Markdown</em>.</p>'
+TO_HTML_PATH = 'journal_common.render.to_html'
+
+
+@pytest.mark.parametrize('url', [
+    'https://example.com',
+    'http://example.com',
+    'mailto:ed@example.com',
+    '/relative/path',
+    '#anchor',
+])
+def test_is_safe_url(url):
+    assert rnd.is_safe_url(url)
+
+
+@pytest.mark.parametrize('url', [
+    'javascript:alert(1)',
+    'JavaScript:alert(1)',
+    ' java\tscript:alert(1)',
+    'javascript&#58;alert(1)',
+    'data:text/html;base64,AAAA',
+    'vbscript:msgbox(1)',
+])
+def test_is_not_safe_url(url):
+    assert not rnd.is_safe_url(url)
+
+
+def test_sanitize_drops_bad_urls():
+    rendered = '<p><a href="javascript:alert(1)">x</a></p>'
+    assert rnd.sanitize(rendered) == f'<p><a href="{rnd.SAFE_URL}">x</a></p>'
+
+
+def test_sanitize_keeps_good_urls():
+    rendered = '<p><a href="https://example.com">x</a></p>'
+    assert rnd.sanitize(rendered) == rendered
+
+
+def test_sanitize_drops_event_attrs():
+    rendered = '<img src="a.png" onerror="alert(1)" />'
+    assert rnd.sanitize(rendered) == '<img src="a.png" />'
+
+
+@patch(TO_HTML_PATH, autospec=True, return_value=RENDERED)
+def test_render_cached(mock_to_html):
+    rnd.render_cache.clear()
+    assert rnd.render(SOURCE) == RENDERED
+    assert rnd.render(SOURCE) == RENDERED
+    assert mock_to_html.call_count == 1
+
+
+@patch(TO_HTML_PATH, autospec=True, side_effect=OSError('No pandoc'))
+def test_render_failure_escaped(mock_to_html):
+    rnd.render_cache.clear()
+    assert rnd.render('<b>') == '<pre>&lt;b&gt;</pre>'
+    assert len(rnd.render_cache) == 0
+
+
+@patch(TO_HTML_PATH, autospec=True, return_value=RENDERED)
+def test_add_html(mock_to_html):
+    flds = {'text': {rnd.cflds.MARKDOWN: 1}, 'title': {}}
+    rec = {'text': SOURCE, 'title': 'A title'}
+    rendered = rnd.add_html(rec, flds)
+    assert rendered[rnd.html_fld('text')] == RENDERED
+    assert rnd.html_fld('title') not in rendered
+    assert rnd.html_fld('text') not in rec
+
+
+@patch(TO_HTML_PATH, autospec=True, return_value=RENDERED)
+def test_render_flds(mock_to_html):
+    flds = {'text': {rnd.cflds.MARKDOWN: 1}, 'title': {}}
+    data = {'title': 'A title', rnd.html_fld('text'): '<script></script>'}
+    assert rnd.render_flds(data, flds) == {'title': 'A title'}
+    data['text'] = SOURCE
+    assert rnd.render_flds(data, flds)[rnd.html_fld('text')] == RENDERED
@@ -0,0 +1,312 @@
+"""
+This converts submitted files to Markdown.
+Converting a large docx can take seconds of CPU, so it runs in a bounded
+pool of worker processes rather than in the request. Each conversion is a
+job: `submit()` returns the job's id at once, and the job's status can be
+polled until it is done. Jobs are stored, so any web worker can answer.
+Conversions are also cached on disk by the SHA-256 of the uploaded file
+and its extension (which decides how it is converted), along with any
+media extracted, so uploading the same file again skips conversion.
+"""
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Event, Lock
+
+import backendcore.common.time_fmts as tfmt
+from backendcore.common.constants import OBJ_ID_NM
+from backendcore.data.caching import needs_cache, get_cache
+
+from journal_common.common import get_collect_name
+
+import manuscripts.core.pandoc_server as pds
+
+DB = 'journalDB'
+COLLECT = 'convert_jobs'
+CACHE_NM = COLLECT
+
+# Job fields:
+MANU_ID = 'manu_id'
+FILEPATH = 'filepath'
+STATUS = 'status'
+ERROR = 'error'
+SUBMITTED = 'submitted'
+FINISHED = 'finished'
+
+# Job statuses:
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+NUM_WORKERS = int(os.getenv('CONVERT_WORKERS', 2))
+MAX_PENDING = int(os.getenv('CONVERT_MAX_PENDING', 16))
+
+TXT = 'txt'
+
+proj_dir = os.getenv('PROJ_DIR', "")
+CACHE_DIR = os.getenv('CONVERT_CACHE_DIR', f'{proj_dir}/journal_conversions')
+CACHED_TEXT = 'text.md'
+MEDIA = pds.MEDIA
+# Stands in for the media directory in cached Markdown:
+MEDIA_DIR_MARK = '{{media_dir}}'
+CACHE_KEY_RE = re.compile(r'^[0-9a-f]{64}-[a-z0-9]+$')
+
+
+class ConversionBusy(ValueError):
+    """
+    Raised when too many conversions are already waiting.
+    """
+
+
+def needs_jobs_cache(fn):
+    """
+    Should be used to decorate any function that uses datacollection methods.
+    """
+    return needs_cache(fn, CACHE_NM, DB,
+                       get_collect_name(COLLECT),
+                       key_fld=OBJ_ID_NM,
+                       no_id=False)
+
+
+def convert(filepath: str, media_dir: str, use_server: bool = False) -> str:
+    """
+    Returns the contents of `filepath` as Markdown, extracting any images
+    into `media_dir`. This is what the worker processes run.
+    We use the pandoc server if `use_server` says it was healthy when the
+    job was submitted, and spawn pandoc otherwise, or if it fails us.
+    """
+    if get_file_ext(filepath) == TXT:
+        with open(filepath, 'r') as f:
+            return '\n'.join(f.readlines())
+    if use_server:
+        try:
+            return pds.convert(filepath, media_dir)
+        except pds.PandocServerError as err:
+            print(f'Falling back to spawning pandoc: {err}')
+    return pds.spawn_convert(filepath, media_dir)
+
+
+def get_file_ext(filepath: str) -> str:
+    return filepath.rsplit('.', 1)[-1].lower()
+
+
+def make_cache_key(content_hash: str, filepath: str) -> str:
+    """
+    The same bytes convert differently as, say, txt and html, so the key
+    is the content hash plus the file's extension.
+    """
+    return f'{content_hash}-{get_file_ext(filepath)}'
+
+
+def get_cache_entry(cache_key: str) -> str:
+    if not CACHE_KEY_RE.match(cache_key):
+        raise ValueError(f'Bad conversion cache key: {cache_key}')
+    return os.path.join(CACHE_DIR, cache_key)
+
+
+def fetch_cached(cache_key: str, media_dir: str) -> str:
+    """
+    Returns the cached Markdown for `cache_key`, or None, copying its
+    media into `media_dir` as a conversion would have.
+    """
+    entry = get_cache_entry(cache_key)
+    try:
+        with open(os.path.join(entry, CACHED_TEXT), 'r') as f:
+            text = f.read()
+        if os.path.isdir(os.path.join(entry, MEDIA)):
+            shutil.copytree(os.path.join(entry, MEDIA),
+                            os.path.join(media_dir, MEDIA),
+                            dirs_exist_ok=True)
+    except OSError:
+        return None
+    return text.replace(f'{MEDIA_DIR_MARK}/{MEDIA}/', f'{media_dir}/{MEDIA}/')
+
+
+def store_cached(cache_key: str, media_dir: str, text: str):
+    """
+    Caches a conversion. The entry is built aside and renamed into place,
+    so readers never see half of one.
+    """
+    entry = get_cache_entry(cache_key)
+    if os.path.exists(entry):
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=CACHE_DIR)
+    try:
+        with open(os.path.join(build_dir, CACHED_TEXT), 'w') as f:
+            f.write(text.replace(f'{media_dir}/{MEDIA}/',
+                                 f'{MEDIA_DIR_MARK}/{MEDIA}/'))
+        if os.path.isdir(os.path.join(media_dir, MEDIA)):
+            shutil.copytree(os.path.join(media_dir, MEDIA),
+                            os.path.join(build_dir, MEDIA))
+        os.rename(build_dir, entry)
+    except OSError:
+        pass  # Someone else cached it first, or the disk is full.
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def convert_and_cache(filepath: str, media_dir: str,
+                      cache_key: str = None, use_server: bool = False) -> str:
+    text = convert(filepath, media_dir, use_server)
+    if cache_key:
+        store_cached(cache_key, media_dir, text)
+    return text
+
+
+pool = None
+pending = {}  # job id -> event set once the job is finished
+pool_lock = Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Call with `pool_lock` held.
+    """
+    global pool
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=NUM_WORKERS)
+    return pool
+
+
+def _reset_pool():
+    """
+    A worker that dies takes the whole pool with it, so we start a new one.
+    Call with `pool_lock` held.
+    """
+    global pool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = None
+
+
+def get_curr_datetime() -> str:
+    return tfmt.datetime_to_iso(tfmt.now())
+
+
+@needs_jobs_cache
+def fetch_dict():
+    return get_cache(COLLECT).fetch_dict()
+
+
+@needs_jobs_cache
+def fetch_by_key(job_id):
+    return get_cache(COLLECT).fetch_by_key(job_id)
+
+
+@needs_jobs_cache
+def update(job_id, update_dict):
+    return get_cache(COLLECT).update(job_id, update_dict, by_id=True)
+
+
+def _start(*args):
+    try:
+        return get_pool().submit(convert_and_cache, *args)
+    except BrokenProcessPool:
+        _reset_pool()
+        return get_pool().submit(convert_and_cache, *args)
+
+
+@needs_jobs_cache
+def submit(manu_id: str, filepath: str, media_dir: str,
+           on_done=None, content_hash: str = None) -> str:
+    """
+    Starts converting `filepath` and returns the job id.
+    When the conversion succeeds, `on_done(text)` is called in this
+    process. Raises ConversionBusy if MAX_PENDING jobs are waiting already.
+    With a `content_hash`, a file we have converted before is taken from
+    the cache, and its job is done before we return.
+    """
+    cache_key = (make_cache_key(content_hash, filepath)
+                 if content_hash else None)
+    text = fetch_cached(cache_key, media_dir) if cache_key else None
+    if text is not None:
+        job_id = get_cache(COLLECT).add({
+            MANU_ID: manu_id,
+            FILEPATH: filepath,
+            STATUS: PENDING,
+            SUBMITTED: get_curr_datetime(),
+        })
+        _finish_cached(job_id, text, on_done)
+        return job_id
+    # The workers can't see the server's health, so we tell them.
+    use_server = pds.ensure_running()
+    with pool_lock:
+        if len(pending) >= MAX_PENDING:
+            raise ConversionBusy('Too many conversions in progress: '
+                                 'please try again shortly.')
+        job_id = get_cache(COLLECT).add({
+            MANU_ID: manu_id,
+            FILEPATH: filepath,
+            STATUS: PENDING,
+            SUBMITTED: get_curr_datetime(),
+        })
+        try:
+            future = _start(filepath, media_dir, cache_key, use_server)
+        except Exception as err:
+            update(job_id, {STATUS: FAILED, ERROR: str(err),
+                            FINISHED: get_curr_datetime()})
+            raise
+        pending[job_id] = Event()
+    future.add_done_callback(
+        lambda done: _finish(job_id, done, on_done))
+    return job_id
+
+
+def _run_on_done(text: str, on_done) -> dict:
+    try:
+        if on_done:
+            on_done(text)
+    except Exception as err:
+        return {STATUS: FAILED, ERROR: str(err),
+                FINISHED: get_curr_datetime()}
+    return {STATUS: DONE, FINISHED: get_curr_datetime()}
+
+
+def _finish_cached(job_id: str, text: str, on_done):
+    update(job_id, _run_on_done(text, on_done))
+
+
+def _finish(job_id: str, future, on_done):
+    try:
+        result = _run_on_done(future.result(), on_done)
+    except Exception as err:
+        # If the pool broke, the next `submit()` replaces it.
+        result = {STATUS: FAILED, ERROR: str(err),
+                  FINISHED: get_curr_datetime()}
+    try:
+        update(job_id, result)
+    finally:
+        with pool_lock:
+            finished = pending.pop(job_id, None)
+        if finished:
+            finished.set()
+
+
+def fetch_status(job_id: str) -> dict:
+    job = fetch_by_key(job_id)
+    if not job:
+        raise ValueError(f'No such conversion job: {job_id}')
+    return job
+
+
+def wait(job_id: str, timeout: float = None) -> dict:
+    """
+    Waits for a job this process submitted to finish, then returns it.
+    """
+    with pool_lock:
+        finished = pending.get(job_id)
+    if finished:
+        finished.wait(timeout)
+    return fetch_status(job_id)
+
+
+def main():
+    print(f'{fetch_dict()=}')
+
+
+if __name__ == '__main__':
+    main()
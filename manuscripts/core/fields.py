@@ -18,6 +18,8 @@ EMAIL_DISP_NAME = 'Contact Email'
 FILENAME = 'file_name'
 HISTORY = 'history'
 HISTORY_DISP_NAME = 'Manuscript history'
+HISTORY_COUNT = 'history_count'
+HISTORY_COUNT_DISP_NAME = 'Number of history entries'
 LAST_UPDATED = 'timeUpdated'
 LAST_UPDATED_DISP_NAME = 'Time last updated'
 REFEREES = 'referees'
@@ -26,6 +28,8 @@ REF_REPORT = 'report'
 REF_VERDICT = 'verdict'
 STATE = 'state'
 STATE_DISP_NAME = 'State'
+SUBMISSION_FILE = 'submission_file'
+SUBMISSION_FILE_DISP_NAME = 'Submitted file'
 TEXT = 'text'
 TEXT_DISP_NAME = 'Manuscript text'
 TEST_FLD_DISP_NM = 'Sample Code'
@@ -33,9 +37,18 @@ TEST_FLD_NM = OBJ_ID_NM
 TITLE = 'title'
 TITLE_DISP_NAME = 'Title'
 VERDICT = 'verdict'
+VERSION = 'version'
+VERSION_DISP_NAME = 'Version'
 WCOUNT = 'wcount'
 WCOUNT_DISP_NAME = 'Word Count'
 
+# What we record about a submitted file:
+FILE_PATH = 'path'
+FILE_EXT = 'ext'
+FILE_SIZE = 'size'
+FILE_SHA256 = 'sha256'
+FILE_MTIME = 'mtime'
+
 FIELDS = {
     OBJ_ID_NM: {
         DISP_NAME: TEST_FLD_DISP_NM,
@@ -65,6 +78,11 @@ FIELDS = {
         DISP_NAME: HISTORY_DISP_NAME,
         cflds.HIDDEN: True,
     },
+    HISTORY_COUNT: {
+        DISP_NAME: HISTORY_COUNT_DISP_NAME,
+        cflds.HIDDEN: True,
+        FLD_TYPE: cflds.INT,
+    },
     REFEREES: {
         DISP_NAME: REFEREES_DISP_NAME,
         cflds.HIDDEN: True,
@@ -73,6 +91,16 @@ FIELDS = {
     LAST_UPDATED: {
         DISP_NAME: LAST_UPDATED_DISP_NAME,
     },
+    VERSION: {
+        DISP_NAME: VERSION_DISP_NAME,
+        cflds.HIDDEN: True,
+        FLD_TYPE: cflds.INT,
+    },
+    SUBMISSION_FILE: {
+        DISP_NAME: SUBMISSION_FILE_DISP_NAME,
+        cflds.HIDDEN: True,
+        FLD_TYPE: cflds.DICT,
+    },
 }
 
 
@@ -0,0 +1,109 @@
+"""
+This compiles the manuscript state table into flat lookup tables.
+States, actions and roles are given integer codes, and for every
+(state, role) pair we precompute a bitmask (and list) of allowed actions,
+and for every (state, action) pair the handler to call.
+So working out what someone may do to a manuscript is a table lookup,
+not a walk through nested dicts.
+"""
+import manuscripts.core.states as mst
+from people.roles import (
+    ROLES,
+    get_valid_roles,
+)
+
+FUNC = 'function'
+
+STATE_CODES = {state: code
+               for code, state in enumerate(mst.get_valid_states())}
+ACTION_CODES = {action: code
+                for code, action in enumerate(mst.get_valid_actions())}
+ROLE_CODES = {role: code
+              for code, role in enumerate(get_valid_roles())}
+
+ALLOWED_MASKS = 'allowed_masks'
+ALLOWED_LISTS = 'allowed_lists'
+HANDLERS = 'handlers'
+
+
+def action_bit(action: str) -> int:
+    return 1 << ACTION_CODES[action]
+
+
+def validate_table(state_table: dict):
+    """
+    Makes sure the state table only mentions known states, actions and
+    roles, that every entry has a handler and at least one role, and that
+    every action can be taken from some state.
+    Raises a ValueError describing the first problem found.
+    """
+    reachable = set()
+    for state, actions in state_table.items():
+        if state not in STATE_CODES:
+            raise ValueError(f'Unknown state in state table: {state}')
+        for action, action_opts in actions.items():
+            if action not in ACTION_CODES:
+                raise ValueError(f'Unknown action {action} in state {state}')
+            if not callable(action_opts.get(FUNC)):
+                raise ValueError(f'No handler for {action} in state {state}')
+            roles = action_opts.get(ROLES)
+            if not roles:
+                raise ValueError(f'No roles for {action} in state {state}')
+            for role in roles:
+                if role not in ROLE_CODES:
+                    raise ValueError(f'Unknown role {role} for {action} '
+                                     f'in state {state}')
+            reachable.add(action)
+    unreachable = set(ACTION_CODES) - reachable
+    if unreachable:
+        raise ValueError(f'Actions not allowed in any state: {unreachable}')
+
+
+def compile_table(state_table: dict) -> dict:
+    """
+    Validates `state_table` and returns the compiled lookup tables.
+    States missing from the table are terminal: nothing can be done there.
+    """
+    validate_table(state_table)
+    masks = [[0] * len(ROLE_CODES) for _ in STATE_CODES]
+    lists = [[[] for _ in ROLE_CODES] for _ in STATE_CODES]
+    handlers = [[None] * len(ACTION_CODES) for _ in STATE_CODES]
+    for state, actions in state_table.items():
+        state_code = STATE_CODES[state]
+        for action, action_opts in actions.items():
+            handlers[state_code][ACTION_CODES[action]] = action_opts[FUNC]
+            for role in action_opts[ROLES]:
+                role_code = ROLE_CODES[role]
+                masks[state_code][role_code] |= action_bit(action)
+                lists[state_code][role_code].append(action)
+    return {
+        ALLOWED_MASKS: masks,
+        ALLOWED_LISTS: lists,
+        HANDLERS: handlers,
+    }
+
+
+def get_actions(fsm: dict, state: str, role: str) -> list:
+    """
+    Returns the actions `role` may take in `state`.
+    """
+    if state not in STATE_CODES or role not in ROLE_CODES:
+        return []
+    return list(fsm[ALLOWED_LISTS][STATE_CODES[state]][ROLE_CODES[role]])
+
+
+def is_allowed(fsm: dict, state: str, role: str, action: str) -> bool:
+    if (state not in STATE_CODES or role not in ROLE_CODES
+            or action not in ACTION_CODES):
+        return False
+    mask = fsm[ALLOWED_MASKS][STATE_CODES[state]][ROLE_CODES[role]]
+    return bool(mask & action_bit(action))
+
+
+def get_handler(fsm: dict, state: str, action: str):
+    """
+    Returns the function handling `action` in `state`, or None.
+    """
+    if state not in STATE_CODES or action not in ACTION_CODES:
+        return None
+    return fsm[HANDLERS][STATE_CODES[state]][ACTION_CODES[action]]
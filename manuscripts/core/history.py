@@ -0,0 +1,161 @@
+"""
+This is our interface to the manuscript history log.
+Every state transition appends one record here, and nothing ever rewrites
+a record. Manuscripts themselves only keep a summary of their latest
+entries: the full history is read from here a page at a time.
+"""
+from bisect import insort
+from threading import Lock
+
+from backendcore.data.caching import needs_cache, get_cache
+from backendcore.common.constants import OBJ_ID_NM
+
+from journal_common.common import get_collect_name
+
+DB = 'journalDB'
+COLLECT = 'manu_history'
+CACHE_NM = COLLECT
+
+ENTRY = 'entry'
+MANU_ID = 'manu_id'
+TIMESTAMP = 'timestamp'
+
+# What a page of history looks like:
+ENTRIES = 'entries'
+LIMIT = 'limit'
+OFFSET = 'offset'
+TOTAL = 'total'
+
+DEF_PAGE_LEN = 20
+MAX_PAGE_LEN = 100
+
+
+def needs_history_cache(fn):
+    """
+    Should be used to decorate any function that uses datacollection methods.
+    """
+    return needs_cache(fn, CACHE_NM, DB,
+                       get_collect_name(COLLECT),
+                       key_fld=OBJ_ID_NM,
+                       no_id=False)
+
+
+# manu_id -> list of (timestamp, record id), oldest first.
+# Built from the cache on first use, then kept current by `append()`.
+manu_index = {}
+index_built = False
+index_lock = Lock()
+
+
+@needs_history_cache
+def fetch_dict():
+    return get_cache(COLLECT).fetch_dict()
+
+
+@needs_history_cache
+def fetch_by_key(rec_id):
+    return get_cache(COLLECT).fetch_by_key(rec_id)
+
+
+def build_index():
+    global index_built
+    recs = fetch_dict()
+    with index_lock:
+        manu_index.clear()
+        for rec_id, rec in recs.items():
+            insort(manu_index.setdefault(rec[MANU_ID], []),
+                   (rec[TIMESTAMP], rec_id))
+        index_built = True
+
+
+def _get_index(manu_id) -> list:
+    if not index_built:
+        build_index()
+    with index_lock:
+        return list(manu_index.get(manu_id, []))
+
+
+@needs_history_cache
+def append(manu_id: str, timestamp: str, entry: dict) -> str:
+    rec_id = get_cache(COLLECT).add({
+        MANU_ID: manu_id,
+        TIMESTAMP: timestamp,
+        ENTRY: entry,
+    })
+    if index_built:
+        with index_lock:
+            insort(manu_index.setdefault(manu_id, []), (timestamp, rec_id))
+    return rec_id
+
+
+def count(manu_id: str) -> int:
+    return len(_get_index(manu_id))
+
+
+def fetch_timestamps(manu_id: str) -> set:
+    return {timestamp for timestamp, rec_id in _get_index(manu_id)}
+
+
+def check_page(offset: int, limit: int):
+    if offset < 0:
+        raise ValueError(f'Bad history offset: {offset}')
+    if limit < 1 or limit > MAX_PAGE_LEN:
+        raise ValueError(f'History page length must be between 1 and '
+                         f'{MAX_PAGE_LEN}')
+
+
+def page_dict(history: dict, offset: int = 0,
+              limit: int = DEF_PAGE_LEN) -> dict:
+    """
+    Pages through a history kept as a {timestamp: entry} dict, the way
+    manuscripts kept it before we had this log.
+    """
+    check_page(offset, limit)
+    timestamps = sorted(history or {}, reverse=True)
+    return {
+        ENTRIES: {timestamp: history[timestamp]
+                  for timestamp in timestamps[offset:offset + limit]},
+        OFFSET: offset,
+        LIMIT: limit,
+        TOTAL: len(timestamps),
+    }
+
+
+def fetch_page(manu_id: str, offset: int = 0,
+               limit: int = DEF_PAGE_LEN) -> dict:
+    """
+    Returns a page of `manu_id`'s history, newest entries first.
+    """
+    check_page(offset, limit)
+    index = _get_index(manu_id)
+    index.reverse()
+    entries = {}
+    for timestamp, rec_id in index[offset:offset + limit]:
+        rec = fetch_by_key(rec_id)
+        if rec:
+            entries[timestamp] = rec[ENTRY]
+    return {
+        ENTRIES: entries,
+        OFFSET: offset,
+        LIMIT: limit,
+        TOTAL: len(index),
+    }
+
+
+@needs_history_cache
+def delete_for_manu(manu_id: str):
+    """
+    Only for when a manuscript itself is deleted.
+    """
+    for timestamp, rec_id in _get_index(manu_id):
+        get_cache(COLLECT).delete(rec_id, by_id=True)
+    with index_lock:
+        manu_index.pop(manu_id, None)
+
+
+def main():
+    print(f'{fetch_dict()=}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+This keeps a `pandoc server` running locally, so converting a document
+is an HTTP request to a warm process rather than starting pandoc anew.
+A background thread checks the server's health every HEALTH_INTERVAL
+seconds, restarting it if it has died or stopped answering, and keeps a
+flag saying whether it is healthy. `ensure_running()` only reads that
+flag, so no request ever waits on a health check or a restart. While the
+server isn't healthy, callers fall back to spawning pandoc as before.
+The server can't write files, so for docx we pull the images out of the
+document ourselves and point the Markdown at them, as --extract-media does.
+Run this as a program to compare its latency with spawning pandoc.
+"""
+import argparse
+import atexit
+import base64
+import os
+import re
+import statistics
+import subprocess
+import time
+import zipfile
+from threading import Event, Lock, Thread
+
+import pypandoc as pdc
+import requests
+
+USE_SERVER = os.getenv('PANDOC_SERVER', '1') == '1'
+HOST = os.getenv('PANDOC_SERVER_HOST', '127.0.0.1')
+PORT = int(os.getenv('PANDOC_SERVER_PORT', 3030))
+CONVERT_TIMEOUT = int(os.getenv('PANDOC_SERVER_TIMEOUT', 120))
+HEALTH_TIMEOUT = 1
+HEALTH_INTERVAL = 10
+START_TIMEOUT = 10
+
+BASE_URL = f'http://{HOST}:{PORT}'
+VERSION_URL = f'{BASE_URL}/version'
+
+# Formats pandoc server wants base64 encoded.
+BINARY_FORMATS = {'docx', 'odt', 'epub'}
+# File extensions that aren't pandoc format names.
+EXT_FORMATS = {'md': 'markdown', 'txt': 'markdown'}
+MEDIA = 'media'
+DOCX_MEDIA_DIR = 'word/media/'
+
+MEDIA_REF_RE = re.compile(r'(\]\(|src=")(media/)')
+
+
+class PandocServerError(RuntimeError):
+    pass
+
+
+server = None
+server_lock = Lock()
+healthy = Event()
+monitor = None
+monitor_lock = Lock()
+
+
+def get_format(filepath: str) -> str:
+    ext = filepath.rsplit('.', 1)[-1].lower()
+    return EXT_FORMATS.get(ext, ext)
+
+
+def is_healthy() -> bool:
+    try:
+        return requests.get(VERSION_URL, timeout=HEALTH_TIMEOUT).ok
+    except requests.RequestException:
+        return False
+
+
+def start():
+    """
+    Starts a server and waits for it to answer. Call with `server_lock`.
+    """
+    global server
+    server = subprocess.Popen(
+        [pdc.get_pandoc_path(), 'server', f'--port={PORT}',
+         f'--timeout={CONVERT_TIMEOUT}'],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        if is_healthy():
+            return
+        time.sleep(0.1)
+    stop()
+    raise PandocServerError('pandoc server did not start.')
+
+
+def stop():
+    """
+    Call with `server_lock` held, except at exit.
+    """
+    global server
+    if server is not None and server.poll() is None:
+        server.terminate()
+        try:
+            server.wait(timeout=HEALTH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    server = None
+
+
+atexit.register(stop)
+
+
+def check_health():
+    """
+    Checks the server once, (re)starting it if need be, and sets the
+    `healthy` flag to match.
+    """
+    with server_lock:
+        if is_healthy():
+            healthy.set()
+            return
+        healthy.clear()
+        stop()
+        try:
+            start()
+        except (OSError, PandocServerError) as err:
+            print(f'Could not start pandoc server: {err}')
+            return
+        healthy.set()
+
+
+def _monitor():
+    while True:
+        check_health()
+        time.sleep(HEALTH_INTERVAL)
+
+
+def ensure_running() -> bool:
+    """
+    Starts the health monitor if it isn't running yet, and returns
+    whether the server was healthy when last checked. Never blocks on
+    the server.
+    """
+    global monitor
+    if not USE_SERVER:
+        return False
+    with monitor_lock:
+        if monitor is None:
+            monitor = Thread(target=_monitor, daemon=True)
+            monitor.start()
+    return healthy.is_set()
+
+
+def wait_until_healthy(timeout: float = START_TIMEOUT) -> bool:
+    """
+    For when we can afford to wait, as our benchmark can.
+    """
+    ensure_running()
+    return USE_SERVER and healthy.wait(timeout)
+
+
+def extract_docx_media(filepath: str, media_dir: str) -> bool:
+    """
+    Copies a docx's images to `media_dir`/media, where --extract-media
+    would have put them. Returns whether there were any.
+    """
+    found = False
+    with zipfile.ZipFile(filepath) as docx:
+        for name in docx.namelist():
+            if not name.startswith(DOCX_MEDIA_DIR) or name.endswith('/'):
+                continue
+            target = os.path.join(media_dir, MEDIA,
+                                  os.path.basename(name))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with docx.open(name) as src, open(target, 'wb') as dst:
+                dst.write(src.read())
+            found = True
+    return found
+
+
+def convert(filepath: str, media_dir: str, to_fmt: str = 'markdown') -> str:
+    """
+    Converts `filepath` with the running server.
+    Raises PandocServerError if the server fails or can't be reached.
+    """
+    from_fmt = get_format(filepath)
+    with open(filepath, 'rb') as f:
+        content = f.read()
+    if from_fmt in BINARY_FORMATS:
+        text = base64.b64encode(content).decode('ascii')
+    else:
+        text = content.decode('utf-8')
+    try:
+        response = requests.post(
+            BASE_URL,
+            json={'text': text, 'from': from_fmt, 'to': to_fmt},
+            headers={'Accept': 'application/json'},
+            timeout=CONVERT_TIMEOUT,
+        )
+    except requests.RequestException as err:
+        raise PandocServerError(f'pandoc server unreachable: {err}')
+    if not response.ok:
+        raise PandocServerError(f'pandoc server error: {response.text}')
+    try:
+        result = response.json()
+    except ValueError as err:
+        raise PandocServerError(f'Bad reply from pandoc server: {err}')
+    output = result.get('output', '')
+    if result.get('base64'):
+        output = base64.b64decode(output).decode('utf-8')
+    if from_fmt == 'docx' and extract_docx_media(filepath, media_dir):
+        output = MEDIA_REF_RE.sub(
+            lambda match: f'{match.group(1)}{media_dir}/{match.group(2)}',
+            output)
+    return output
+
+
+def spawn_convert(filepath: str, media_dir: str) -> str:
+    """
+    The old way: a new pandoc process per document.
+    """
+    return pdc.convert_file(filepath, 'markdown',
+                            extra_args=[f'--extract-media={media_dir}'])
+
+
+def time_runs(convert_fn, filepath: str, media_dir: str,
+              runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        convert_fn(filepath, media_dir)
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare pandoc server latency with spawning pandoc.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--media-dir', default='/tmp/pandoc_bench')
+    args = parser.parse_args()
+    if not wait_until_healthy():
+        raise SystemExit('Could not start pandoc server.')
+    for filepath in args.files:
+        for label, convert_fn in [('spawn', spawn_convert),
+                                  ('server', convert)]:
+            times = time_runs(convert_fn, filepath, args.media_dir,
+                              args.runs)
+            print(f'{filepath} {label}: '
+                  f'median {statistics.median(times) * 1000:.1f} ms, '
+                  f'mean {statistics.mean(times) * 1000:.1f} ms, '
+                  f'max {max(times) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,17 @@ This is our interface to our manuscript data.
 We never expect our users to add or delete manuscripts,
 so we make no provisions for that.
 """
+import argparse
 import os
 import glob
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from functools import partial
+from threading import Lock, RLock, local
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 
-import pypandoc as pdc
-
 from backendcore.data.caching import needs_cache, get_cache
 from backendcore.common.constants import (
     CODE,
@@ -17,9 +21,10 @@ from backendcore.common.constants import (
     NAME,
 )
 import backendcore.common.time_fmts as tfmt
-from backendcore.emailer.api_send import send_mail
 
 from journal_common.common import get_collect_name
+import journal_common.outbox as outbox
+import journal_common.render as rnd
 
 import people.query as pqry
 from people.roles import (
@@ -32,16 +37,25 @@ from people.roles import (
 from manuscripts.core.fields import (
     ABSTRACT,
     AUTHORS,
+    FILE_EXT,
+    FILE_MTIME,
+    FILE_PATH,
+    FILE_SHA256,
+    FILE_SIZE,
     HISTORY,
+    HISTORY_COUNT,
     LAST_UPDATED,
     OBJ_ID_NM,
     REFEREES,
     REF_REPORT,
     REF_VERDICT,
     STATE,
+    SUBMISSION_FILE,
     TEXT,
     TITLE,
+    VERSION,
     WCOUNT,
+    get_flds,
 )
 
 from manuscripts.core.add_form import ( # noqa E402
@@ -50,6 +64,10 @@ from manuscripts.core.add_form import ( # noqa E402
     TEXT_ENTRY,
 )
 
+import manuscripts.core.convert as cnv
+import manuscripts.core.fsm as fsm
+from manuscripts.core.fsm import FUNC
+import manuscripts.core.history as hist
 import manuscripts.core.states as mst
 from manuscripts.core.states import (
     ACCEPT,
@@ -121,49 +139,149 @@ def fetch_by_key(manu_id):
     return get_cache(COLLECT).fetch_by_key(manu_id)
 
 
-@needs_manuscripts_cache
-def update_fld(manu_id, fld, val):
-    return get_cache(COLLECT).update_fld(manu_id, fld, val, by_id=True)
+def update_fld(manu_id, fld, val, expected_version: int = None):
+    return update(manu_id, {fld: val}, expected_version=expected_version)
 
 
 def fetch_by_id(manu_id):
     return fetch_by_key(manu_id)
 
 
-def get_last_updated(manu_id):
-    if not exists(manu_id):
+# Request-scoped record memo.
+# Inside a `record_context()`, each manuscript is pulled from the cache at
+# most once, and every getter below is served from that copy. Writes
+# through this module drop the memoized copy so we never serve stale data.
+STORE_HITS = 'store_hits'
+SAVED_HITS = 'saved_hits'
+
+record_memo = local()
+record_stats = {
+    STORE_HITS: 0,
+    SAVED_HITS: 0,
+}
+
+
+def get_record_stats() -> dict:
+    return dict(record_stats)
+
+
+def reset_record_stats():
+    for stat in record_stats:
+        record_stats[stat] = 0
+
+
+def _get_memo():
+    return getattr(record_memo, 'records', None)
+
+
+@contextmanager
+def record_context():
+    """
+    Opens a record context for the current thread.
+    Nested contexts share the outermost one's records.
+    """
+    if _get_memo() is not None:
+        yield
+        return
+    record_memo.records = {}
+    record_memo.versions = {}
+    try:
+        yield
+    finally:
+        record_memo.records = None
+        record_memo.versions = None
+
+
+def forget_record(manu_id):
+    records = _get_memo()
+    if records is not None:
+        records.pop(manu_id, None)
+
+
+def lookup_record(manu_id):
+    """
+    Returns the manuscript or None if there is no such manuscript.
+    """
+    records = _get_memo()
+    if records is not None and manu_id in records:
+        record_stats[SAVED_HITS] += 1
+        return records[manu_id]
+    record_stats[STORE_HITS] += 1
+    manu = fetch_by_key(manu_id)
+    if records is not None:
+        records[manu_id] = manu
+    return manu
+
+
+def fetch_record(manu_id):
+    """
+    Like `lookup_record()`, but a missing manuscript is an error.
+    """
+    manu = lookup_record(manu_id)
+    if not manu:
         raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_id(manu_id).get(LAST_UPDATED, None)
+    return manu
+
+
+# Optimistic concurrency: every manuscript carries a version number that
+# each write bumps. Writers pass the version they read, and a write against
+# a stale version fails instead of silently overwriting someone else's.
+# The per-manuscript locks only cover a compare and the write after it.
+class VersionConflict(ValueError):
+    pass
+
+
+manu_locks = {}
+manu_locks_lock = Lock()
+
+
+def get_manu_lock(manu_id: str) -> RLock:
+    with manu_locks_lock:
+        return manu_locks.setdefault(manu_id, RLock())
+
+
+def get_version_of(manu: dict) -> int:
+    return manu.get(VERSION, 0)
+
+
+def note_version(manu_id, version: int):
+    versions = getattr(record_memo, 'versions', None)
+    if versions is not None:
+        versions[manu_id] = version
+
+
+def get_version(manu_id) -> int:
+    """
+    Returns the version this request last read or wrote for `manu_id`.
+    """
+    versions = getattr(record_memo, 'versions', None)
+    if versions and manu_id in versions:
+        return versions[manu_id]
+    return get_version_of(fetch_record(manu_id))
+
+
+def get_last_updated(manu_id):
+    return fetch_record(manu_id).get(LAST_UPDATED, None)
 
 
 def get_state(manu_id):
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_id(manu_id).get(STATE, None)
+    return fetch_record(manu_id).get(STATE, None)
 
 
 def get_title(manu_id):
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_id(manu_id).get(TITLE, None)
+    return fetch_record(manu_id).get(TITLE, None)
 
 
 def get_abstract(manu_id):
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_id(manu_id).get(ABSTRACT, None)
+    return fetch_record(manu_id).get(ABSTRACT, None)
 
 
 def get_text(manu_id):
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_id(manu_id).get(TEXT, None)
+    return fetch_record(manu_id).get(TEXT, None)
 
 
 def get_authors(manu_id):
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_id(manu_id).get(AUTHORS, None)
+    return fetch_record(manu_id).get(AUTHORS, None)
 
 
 def get_editor_email(manu_id):
@@ -176,7 +294,87 @@ def get_editor_email(manu_id):
 
 
 def exists(code):
-    return code in fetch_dict()
+    return lookup_record(code) is not None
+
+
+# The visibility index: who can see which manuscripts.
+# Editors see every manuscript, so we only need to index authors (by email)
+# and referees (by id). It is built from the cache on first use, and
+# `add`, `update`, `update_fld` and `delete` keep it current.
+VISIBILITY_FLDS = {AUTHORS, REFEREES}
+
+author_index = {}
+referee_index = {}
+indexed_manus = {}
+index_built = False
+index_lock = Lock()
+
+
+def _unindex_manu(manu_id: str):
+    emails, refs = indexed_manus.pop(manu_id, (set(), set()))
+    for email in emails:
+        author_index.get(email, set()).discard(manu_id)
+    for ref_id in refs:
+        referee_index.get(ref_id, set()).discard(manu_id)
+
+
+def _index_manu(manu_id: str, manu: dict):
+    _unindex_manu(manu_id)
+    emails = {pqry.normalize_email(author.get(EMAIL))
+              for author in manu.get(AUTHORS) or []}
+    emails.discard(None)
+    refs = set(manu.get(REFEREES) or {})
+    for email in emails:
+        author_index.setdefault(email, set()).add(manu_id)
+    for ref_id in refs:
+        referee_index.setdefault(ref_id, set()).add(manu_id)
+    indexed_manus[manu_id] = (emails, refs)
+
+
+def build_visibility_index():
+    global index_built
+    manus = fetch_dict()
+    with index_lock:
+        author_index.clear()
+        referee_index.clear()
+        indexed_manus.clear()
+        for manu_id, manu in manus.items():
+            _index_manu(manu_id, manu)
+        index_built = True
+
+
+def reindex_manu(manu_id: str):
+    """
+    Called after any write that might change who can see `manu_id`.
+    If the index hasn't been built yet, there is nothing to maintain.
+    """
+    if not index_built:
+        return
+    manu = fetch_by_key(manu_id)
+    with index_lock:
+        if manu:
+            _index_manu(manu_id, manu)
+        else:
+            _unindex_manu(manu_id)
+
+
+def get_visible_manu_ids(person_id: str) -> set:
+    """
+    Returns the ids of all manuscripts `person_id` may see.
+    """
+    if not index_built:
+        build_visibility_index()
+    person = pqry.fetch_by_key(person_id)
+    if not person:
+        return set()
+    with index_lock:
+        if pqry.is_editor(person):
+            return set(indexed_manus)
+        visible = set(referee_index.get(person_id, set()))
+        email = pqry.normalize_email(person.get(EMAIL))
+        if email:
+            visible |= author_index.get(email, set())
+    return visible
 
 
 TEST_CODE = 'BK'
@@ -226,19 +424,6 @@ def is_valid_file(filename):
 TEST_FILE_OBJ = FileStorage(filename=f'good_name.{get_valid_exts()[0]}')
 
 
-def convert_file(filepath, SUBMIT_DIR):
-    if get_file_ext(filepath) != 'txt':
-        output = pdc.convert_file(
-            filepath,
-            'markdown',
-            extra_args=[f'--extract-media={SUBMIT_DIR}']
-        )
-    else:
-        with open(filepath, 'r') as f:
-            output = '\n'.join(f.readlines())
-    return output
-
-
 def get_submission_directory(upload_dir, id):
     NEW_PATH = os.path.join(upload_dir, id)
     if os.path.exists(NEW_PATH):
@@ -247,48 +432,122 @@ def get_submission_directory(upload_dir, id):
     return NEW_PATH
 
 
-def process_file(file, SUBMIT_DIR):
-    output = ''
-    if file:
-        filename = secure_filename(file.filename)
-        if not is_valid_file(filename):
-            raise ValueError('Error: valid file types are: '
-                             + f'{get_valid_exts()}')
-        filepath = os.path.join(SUBMIT_DIR, filename)
-        file.save(filepath)
-        output = convert_file(filepath, SUBMIT_DIR)
-    return output, filename
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 50 * 1024 * 1024))
+UPLOAD_TEMP_PREFIX = '.upload-'
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def check_upload_size(size: int, max_size: int = MAX_UPLOAD_SIZE):
+    if size is not None and size > max_size:
+        raise UploadTooLarge(f'Uploads may be at most {max_size} bytes.')
+
+
+def ingest_file(stream, filename: str, SUBMIT_DIR: str, _id: str,
+                max_size: int = MAX_UPLOAD_SIZE) -> tuple:
+    """
+    Copies an upload from `stream` to `SUBMIT_DIR`/`_id`.<ext> a chunk at
+    a time, hashing and counting bytes as they go by, so memory use doesn't
+    depend on the upload's size. The bytes land in a temp file that is
+    renamed into place only once all of them have arrived: an upload that
+    fails, or grows past `max_size`, leaves nothing behind.
+    Returns the file's path, its SHA-256 and its size.
+    """
+    filename = secure_filename(filename or '')
+    if not is_valid_file(filename):
+        raise ValueError('Error: valid file types are: '
+                         + f'{get_valid_exts()}')
+    filepath = os.path.join(SUBMIT_DIR, f'{_id}.{get_file_ext(filename)}')
+    content_hash = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=SUBMIT_DIR,
+                                     prefix=UPLOAD_TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as dst:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                check_upload_size(size, max_size)
+                content_hash.update(chunk)
+                dst.write(chunk)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return filepath, content_hash.hexdigest(), size
+
+
+def record_submission_file(_id: str, filepath: str, content_hash: str,
+                           size: int):
+    """
+    Stores what we know about a manuscript's submitted file on the
+    manuscript, so finding it later is a field read, not a directory scan.
+    """
+    update(_id, {SUBMISSION_FILE: {
+        FILE_PATH: filepath,
+        FILE_EXT: get_file_ext(filepath),
+        FILE_SIZE: size,
+        FILE_SHA256: content_hash,
+        FILE_MTIME: os.stat(filepath).st_mtime,
+    }})
 
 
 def save_text_as_file(_id: str) -> dict:
     text = get_text(_id)
     SUBMIT_DIR = get_submission_directory(UPLOAD_DIR, _id)
     filename = f'{SUBMIT_DIR}/{_id}.md'
-    with open(filename, 'w') as mdfile:
-        mdfile.write(text)
-        return (text, filename)
-    raise ValueError('Could not write to file.')
+    content = text.encode('utf-8')
+    with open(filename, 'wb') as mdfile:
+        mdfile.write(content)
+    record_submission_file(_id, filename,
+                           hashlib.sha256(content).hexdigest(),
+                           len(content))
+    return (text, filename)
+
+
+def finish_file(_id: str, text: str):
+    """
+    Called once an uploaded file has been converted.
+    """
+    update(_id, {TEXT: text})
+    notify_editor(_id)
+
+
+def add_file_stream(_id: str, stream, filename: str) -> str:
+    """
+    Saves an upload read from `stream` to the local directory, and starts
+    converting it. When conversion is done, the manuscript's text is set
+    from it and the editor is notified. Returns the conversion job id.
+    """
+    if not exists(_id):
+        raise ValueError(f'No such manuscript id: {_id}')
+    SUBMIT_DIR = get_submission_directory(UPLOAD_DIR, _id)
+    filepath, content_hash, size = ingest_file(stream, filename,
+                                               SUBMIT_DIR, _id)
+    record_submission_file(_id, filepath, content_hash, size)
+    return cnv.submit(_id, filepath, SUBMIT_DIR,
+                      on_done=partial(finish_file, _id),
+                      content_hash=content_hash)
 
 
-def add_file(_id: str, dict_of_files: dict) -> dict:
+def add_file(_id: str, dict_of_files: dict) -> str:
     """
-    Uploads a file to the local directory, then notifies the editor.
+    Uploads a file to the local directory, and starts converting it.
+    Returns the conversion job id, or None if there was no file, and we
+    saved the manuscript's text as one instead.
     """
     if not dict_of_files:
-        return save_text_as_file(_id)
+        save_text_as_file(_id)
+        return None
         # raise ValueError('Empty dict_of_files dictionary passed.')
     file_obj = None
     file_obj = dict_of_files.get(MANU_FILE, None)
     if not file_obj:
         raise ValueError('No file in dict_of_files.')
-    SUBMIT_DIR = get_submission_directory(UPLOAD_DIR, _id)
-    (text, filename) = process_file(file_obj, SUBMIT_DIR)
-    if filename:
-        os.rename(f'{SUBMIT_DIR}/{filename}',
-                  f'{SUBMIT_DIR}/{_id}.{get_file_ext(filename)}')
-    update(_id, {TEXT: text})
-    notify_editor(_id)
-    return (text, filename)
+    return add_file_stream(_id, file_obj.stream, file_obj.filename)
 
 
 def is_file_entry(manu_data: dict) -> bool:
@@ -298,16 +557,12 @@ def is_file_entry(manu_data: dict) -> bool:
 def set_manuscript_defaults(manu_data):
     manu_data[STATE] = mst.SUBMITTED
     manu_data[LAST_UPDATED] = get_curr_datetime()
+    manu_data[VERSION] = 0
     manu_data[TEXT] = manu_data.get(TEXT_ENTRY)
 
 
 def add_authors(authors: list):
-    for author in authors:
-        pqry.possibly_new_person_add_role(
-            author.get(EMAIL),
-            AU,
-            author.get(NAME)
-        )
+    return pqry.ensure_people_with_role(authors, AU)
 
 
 def add_ref_report(reports: list):
@@ -317,12 +572,15 @@ def add_ref_report(reports: list):
 
 @needs_manuscripts_cache
 def add(manu_data):
+    manu_data = rnd.render_flds(manu_data, get_flds())
     set_manuscript_defaults(manu_data)
     add_authors(manu_data[AUTHORS])
     # For testing we may add a manuscript that already has refs!
     if not manu_data.get(REFEREES):
         manu_data[REFEREES] = {}
     ret = get_cache(COLLECT).add(manu_data)
+    forget_record(ret)
+    reindex_manu(ret)
     update_history(manu_id=ret,
                    action=SUBMITTED,
                    new_state=SUBMITTED)
@@ -331,12 +589,37 @@ def add(manu_data):
 
 @needs_manuscripts_cache
 def delete(code):
-    return get_cache(COLLECT).delete(code, by_id=True)
+    ret = get_cache(COLLECT).delete(code, by_id=True)
+    hist.delete_for_manu(code)
+    with manu_locks_lock:
+        manu_locks.pop(code, None)
+    forget_record(code)
+    reindex_manu(code)
+    return ret
 
 
 @needs_manuscripts_cache
-def update(code, update_dict):
-    return get_cache(COLLECT).update(code, update_dict, by_id=True)
+def update(code, update_dict, expected_version: int = None):
+    """
+    Every write bumps the manuscript's version. If `expected_version` is
+    passed, the write only goes through if the manuscript is still at
+    that version: otherwise we raise VersionConflict.
+    Markdown fields are rendered here, so reads never have to.
+    """
+    update_dict = rnd.render_flds(update_dict, get_flds())
+    with get_manu_lock(code):
+        manu = fetch_by_key(code)
+        curr_version = get_version_of(manu) if manu else 0
+        if expected_version is not None and curr_version != expected_version:
+            raise VersionConflict(f'Manuscript {code} is at version '
+                                  f'{curr_version}, not {expected_version}')
+        update_dict = {**update_dict, VERSION: curr_version + 1}
+        ret = get_cache(COLLECT).update(code, update_dict, by_id=True)
+        forget_record(code)
+        note_version(code, curr_version + 1)
+    if VISIBILITY_FLDS & set(update_dict):
+        reindex_manu(code)
+    return ret
 
 
 @needs_manuscripts_cache
@@ -347,21 +630,35 @@ def fetch_by_state(state: str) -> list:
 
 
 def get_referees(manu_id: str) -> list:
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    return fetch_by_key(manu_id).get(REFEREES, {})
+    return fetch_record(manu_id).get(REFEREES, {})
 
 
-def get_original_submission_filename(manu_id):
-    if not exists(manu_id):
-        raise ValueError(f'No such manuscript id: {manu_id}')
-    SUBMIT_DIR = get_submission_directory(UPLOAD_DIR, manu_id)
-    fileglob = glob.glob(f'{SUBMIT_DIR}/{manu_id}.*')
+def find_legacy_submission(manu_id: str) -> str:
+    """
+    Manuscripts submitted before we recorded their files: look on disk,
+    but never create anything while doing so.
+    """
+    fileglob = glob.glob(os.path.join(UPLOAD_DIR, manu_id, f'{manu_id}.*'))
     if len(fileglob) < 1:
         return ''
     return fileglob[0]
 
 
+def get_submission_file(manu_id: str) -> dict:
+    """
+    Returns what we recorded about the manuscript's submitted file, if
+    anything.
+    """
+    return fetch_record(manu_id).get(SUBMISSION_FILE) or {}
+
+
+def get_original_submission_filename(manu_id):
+    sub_file = get_submission_file(manu_id)
+    if sub_file:
+        return sub_file.get(FILE_PATH, '')
+    return find_legacy_submission(manu_id)
+
+
 def get_curr_datetime():
     return tfmt.datetime_to_iso(tfmt.now())
 
@@ -381,6 +678,7 @@ def set_state(manu_id, state):
 REFEREE_ARG = 'referee'
 
 
+@record_context()
 def notify_referee(manu_id: str, referee: str):
     """
     When a referee is initially added, we send out an email letting them know
@@ -395,11 +693,11 @@ def notify_referee(manu_id: str, referee: str):
     abstract = get_abstract(manu_id)
     email_content = (f'Hello {email} you\'ve been asked to referee the '
                      f'manuscript {title}. The abstract is: <br> {abstract}')
-    ret = send_mail(to_emails=email, subject='Manuscript Referee',
-                    content=email_content, reply_email=reply_email)
-    return ret
+    return outbox.enqueue(to_emails=email, subject='Manuscript Referee',
+                          content=email_content, reply_email=reply_email)
 
 
+@record_context()
 def notify_editor(manu_id: str):
     """
     When a manuscript is submitted, we email the editor to let them know they
@@ -417,9 +715,9 @@ def notify_editor(manu_id: str):
         email_content += (' Only text was provided. It is attached here:'
                           f' {text}')
         file = None
-    ret = send_mail(to_emails=email, subject='New Manuscript Submitted',
-                    content=email_content, file=file)
-    return ret
+    return outbox.enqueue(to_emails=email,
+                          subject='New Manuscript Submitted',
+                          content=email_content, file=file)
 
 
 def assign_referee(manu_id: str, **kwargs):
@@ -430,10 +728,13 @@ def assign_referee(manu_id: str, **kwargs):
     if not ref_id:
         raise ValueError(f'Must provide \'{REFEREE_ARG}\' value to assign a '
                          'referee.')
-    refs = get_referees(manu_id)
+    # Read the version first, and change a copy, so that a VersionConflict
+    # leaves the cached record as it was.
+    version = get_version(manu_id)
+    refs = dict(get_referees(manu_id))
     if ref_id not in refs:
         refs[ref_id] = {}
-    update_fld(manu_id, REFEREES, refs)
+    update_fld(manu_id, REFEREES, refs, expected_version=version)
     ref = pqry.fetch_by_key(ref_id)
     if ref:
         pqry.add_role(ref, RE)
@@ -446,11 +747,12 @@ def remove_referee(manu_id, **kwargs):
     if not ref_id:
         raise ValueError(f'Must provide \'{REFEREE_ARG}\' value to remove a '
                          'referee.')
-    refs = get_referees(manu_id)
+    version = get_version(manu_id)
+    refs = dict(get_referees(manu_id))
     if ref_id not in refs:
         raise ValueError(f'Referee {ref_id} not found')
     del refs[ref_id]
-    update_fld(manu_id, REFEREES, refs)
+    update_fld(manu_id, REFEREES, refs, expected_version=version)
     if len(refs) == 0:
         return SUBMITTED
     else:
@@ -462,15 +764,166 @@ NEW_STATE = 'new_state'
 ACTION = 'action'
 
 
-def update_history(manu_id: str, action: str, new_state: str, **kwargs):
-    history = fetch_by_key(manu_id).get(HISTORY, {})
+def make_history_entry(action: str, new_state: str, **kwargs) -> dict:
     history_dict = {}
     history_dict[NEW_STATE] = new_state
     history_dict[ACTION] = action
     for key, value in kwargs.items():
         history_dict[key] = value
-    history[get_curr_datetime()] = history_dict
-    return update_fld(manu_id, HISTORY, history)
+    return history_dict
+
+
+# The full history lives in the history log: a manuscript only keeps its
+# latest HISTORY_SUMMARY_LEN entries, plus a count of all of them.
+HISTORY_SUMMARY_LEN = 10
+
+
+def summarize_history(history: dict, timestamp: str, entry: dict) -> dict:
+    """
+    Returns a new summary with `entry` added and only the latest entries
+    kept. Our timestamps are ISO strings, so they sort by time.
+    """
+    history = {**(history or {}), timestamp: entry}
+    latest = sorted(history)[-HISTORY_SUMMARY_LEN:]
+    return {timestamp: history[timestamp] for timestamp in latest}
+
+
+def get_history_count(manu: dict) -> int:
+    return manu.get(HISTORY_COUNT, len(manu.get(HISTORY) or {}))
+
+
+def is_history_logged(manu: dict) -> bool:
+    """
+    Manuscripts from before the history log keep their whole history in
+    HISTORY, and have no HISTORY_COUNT.
+    """
+    return HISTORY_COUNT in manu
+
+
+def backfill_history(manu_id: str, manu: dict):
+    """
+    Copies a legacy manuscript's embedded history into the log, skipping
+    any entries already there, so it is safe to run more than once.
+    Call with the manuscript's lock held, before its summary is cut down.
+    """
+    logged = hist.fetch_timestamps(manu_id)
+    for timestamp, entry in sorted((manu.get(HISTORY) or {}).items()):
+        if timestamp not in logged:
+            hist.append(manu_id, timestamp, entry)
+
+
+def record_history(manu_id: str, action: str, new_state: str,
+                   expected_version: int = None, upd_flds: dict = None,
+                   curr_datetime: str = None, **kwargs):
+    """
+    Appends a history entry to the log and writes the manuscript's new
+    history summary, along with any other fields in `upd_flds`, in one
+    update. Returns the timestamp used for the entry.
+    """
+    if not curr_datetime:
+        curr_datetime = get_curr_datetime()
+    with get_manu_lock(manu_id):
+        manu = fetch_by_key(manu_id)
+        if not manu:
+            raise ValueError(f'No such manuscript id: {manu_id}')
+        if not is_history_logged(manu):
+            backfill_history(manu_id, manu)
+        entry = make_history_entry(action, new_state, **kwargs)
+        update(manu_id, {
+            **(upd_flds or {}),
+            HISTORY: summarize_history(manu.get(HISTORY), curr_datetime,
+                                       entry),
+            HISTORY_COUNT: get_history_count(manu) + 1,
+        }, expected_version=expected_version)
+        hist.append(manu_id, curr_datetime, entry)
+        return curr_datetime
+
+
+def update_history(manu_id: str, action: str, new_state: str, **kwargs):
+    return record_history(manu_id, action, new_state, **kwargs)
+
+
+def apply_transition(manu_id: str, action: str, new_state: str,
+                     expected_version: int = None, **kwargs) -> dict:
+    """
+    Moves a manuscript to `new_state`: the state, the last-updated time and
+    the history summary are all written in one update, and the new history
+    entry is appended to the log.
+    Raises VersionConflict if `expected_version` is passed and stale.
+    Returns the updated manuscript.
+    """
+    if new_state not in mst.get_valid_states():
+        raise ValueError(f'Invalid state code {new_state}.')
+    curr_datetime = get_curr_datetime()
+    record_history(manu_id, action, new_state,
+                   expected_version=expected_version,
+                   upd_flds={
+                       STATE: new_state,
+                       LAST_UPDATED: curr_datetime,
+                   },
+                   curr_datetime=curr_datetime,
+                   **kwargs)
+    return fetch_by_key(manu_id)
+
+
+def fetch_history(manu_id: str, email: str, offset: int = 0,
+                  limit: int = hist.DEF_PAGE_LEN) -> dict:
+    """
+    Returns a page of a manuscript's history, newest first, as long as the
+    user is allowed to see the manuscript.
+    """
+    person_id = pqry.fetch_id_by_email(email)
+    if not person_id or manu_id not in get_visible_manu_ids(person_id):
+        raise ValueError(f'No manuscript {manu_id} visible to {email}')
+    manu = fetch_record(manu_id)
+    if not is_history_logged(manu):
+        return hist.page_dict(manu.get(HISTORY), offset=offset, limit=limit)
+    return hist.fetch_page(manu_id, offset=offset, limit=limit)
+
+
+def migrate_history() -> int:
+    """
+    Moves every legacy manuscript's history into the log.
+    Returns how many manuscripts were migrated.
+    """
+    migrated = 0
+    for manu_id in fetch_dict():
+        with get_manu_lock(manu_id):
+            manu = fetch_by_key(manu_id)
+            if not manu or is_history_logged(manu):
+                continue
+            backfill_history(manu_id, manu)
+            update(manu_id, {
+                HISTORY: dict(sorted((manu.get(HISTORY) or {}).items())
+                              [-HISTORY_SUMMARY_LEN:]),
+                HISTORY_COUNT: len(manu.get(HISTORY) or {}),
+            })
+        migrated += 1
+    return migrated
+
+
+def get_unrendered(manu: dict) -> dict:
+    """
+    Returns the Markdown fields of `manu` that have no stored HTML.
+    """
+    return {fld_nm: manu[fld_nm]
+            for fld_nm in rnd.get_markdown_flds(get_flds())
+            if isinstance(manu.get(fld_nm), str)
+            and rnd.html_fld(fld_nm) not in manu}
+
+
+def render_markdown() -> int:
+    """
+    Renders and stores the Markdown fields of manuscripts written before
+    we stored their HTML. Returns how many manuscripts were rendered.
+    """
+    rendered = 0
+    for manu_id, manu in fetch_dict().items():
+        missing = get_unrendered(manu)
+        if missing:
+            update(manu_id, missing)
+            rendered += 1
+    return rendered
 
 
 @needs_manuscripts_cache
@@ -480,12 +933,7 @@ def update_state(manu_id, state, referee: str = None):
     If state is changed to assign_referee or remove_referee the referee
     must also be provided
     """
-    if state not in mst.get_valid_states():
-        raise ValueError(f'Invalid state code {state}.')
-    ret = set_state(manu_id, state)
-    update_history(manu_id, state, referee)
-    set_last_updated(manu_id)
-    return ret
+    return apply_transition(manu_id, state, state, **{REFEREE_ARG: referee})
 
 
 def editor_move(state, **kwargs):
@@ -497,7 +945,6 @@ def editor_move(state, **kwargs):
     return state
 
 
-FUNC = 'function'
 STATE_MAP = 'state_map'
 DESTINATION = 'destination'
 
@@ -587,6 +1034,8 @@ STATE_TABLE = {
     },
 }
 
+FSM = fsm.compile_table(STATE_TABLE)
+
 
 def is_referee_for(person_id, manu_id):
     """
@@ -602,9 +1051,11 @@ def is_author_for(person_id, manu_id):
     the manuscript.
     """
     authors = get_authors(manu_id)
-    email = pqry.get_email(person_id)
+    email = pqry.normalize_email(pqry.get_email(person_id))
+    if not email:
+        return False
     for author in authors:
-        if author.get(EMAIL) == email:
+        if pqry.normalize_email(author.get(EMAIL)) == email:
             return True
     return False
 
@@ -641,38 +1092,126 @@ def is_valid_action(manu_id, person_id, action):
     """
     user_role = get_users_role_for_manu(person_id, manu_id)
     state = get_state(manu_id)
-    valid_roles = STATE_TABLE.get(state).get(action).get(ROLES)
-    return user_role in valid_roles
+    return fsm.is_allowed(FSM, state, user_role, action)
 
 
-def receive_action(manu_id, action, email: str = None, **kwargs):
+def check_action(manu_id, action, person_id: str = None,
+                 version: int = None):
     """
-    Currently we have 'referee', 'state' kwargs.
+    Makes sure `action` can be applied to `manu_id` right now (and by
+    `person_id`, if passed), and returns the function that handles it.
+    Raises ValueError, or VersionConflict if `version` is stale.
     """
     if not exists(manu_id):
         raise ValueError(f'Invalid manuscript id: {manu_id}')
     if not mst.is_valid_action(action):
         raise ValueError(f'Invalid action: {action}')
-    if email:
-        person_id = pqry.fetch_id_by_email(email)
+    if person_id:
         if not is_valid_action(manu_id, person_id, action):
-            raise ValueError(f'{email} is not allowed to perform {action}'
-                             f' on {manu_id}')
+            raise ValueError(f'{person_id} is not allowed to perform '
+                             f'{action} on {manu_id}')
+    curr_version = get_version(manu_id)
+    if version is not None and version != curr_version:
+        raise VersionConflict(f'Manuscript {manu_id} is at version '
+                              f'{curr_version}, not {version}')
     curr_state = get_state(manu_id)
-    action_opts = STATE_TABLE[curr_state].get(action, {})
-    func = action_opts.get(FUNC, None)
-    if func:
-        new_state = func(manu_id, **kwargs)
-        set_state(manu_id, new_state)
-        set_last_updated(manu_id)
-        update_history(manu_id=manu_id,
-                       action=action,
-                       new_state=new_state,
-                       **kwargs)
-        return new_state
-    else:
+    func = fsm.get_handler(FSM, curr_state, action)
+    if not func:
         raise ValueError(f'Action {action} is invalid in the current state: '
                          f'{curr_state}')
+    return func
+
+
+def run_action(manu_id, action, func, **kwargs) -> str:
+    new_state = func(manu_id, **kwargs)
+    apply_transition(manu_id, action, new_state,
+                     expected_version=get_version(manu_id), **kwargs)
+    return new_state
+
+
+def get_person_id_for(email: str) -> str:
+    person_id = pqry.fetch_id_by_email(email)
+    if not person_id:
+        raise ValueError(f'{email} is not a known person')
+    return person_id
+
+
+@record_context()
+def receive_action(manu_id, action, email: str = None, version: int = None,
+                   **kwargs):
+    """
+    Currently we have 'referee', 'state' kwargs.
+    If `version` is passed, the action is only applied if the manuscript is
+    still at that version; otherwise we raise VersionConflict.
+    """
+    person_id = get_person_id_for(email) if email else None
+    func = check_action(manu_id, action, person_id=person_id,
+                        version=version)
+    return run_action(manu_id, action, func, **kwargs)
+
+
+# What a batch of actions looks like: a list of dicts with these keys.
+# The results list has one dict per request, with either a new state or
+# an error.
+MANU_ID = 'manu_id'
+VERSION_ARG = 'version'
+KWARGS = 'kwargs'
+ERROR = 'error'
+CONFLICT = 'conflict'
+
+
+def make_action_result(manu_id, action, new_state=None, error=None,
+                       conflict=False) -> dict:
+    result = {MANU_ID: manu_id, ACTION: action}
+    if error:
+        result[ERROR] = error
+        result[CONFLICT] = conflict
+    else:
+        result[NEW_STATE] = new_state
+    return result
+
+
+@record_context()
+def receive_actions(action_reqs: list, email: str = None) -> list:
+    """
+    Applies a batch of actions, possibly to many manuscripts.
+    The caller is looked up once, and every request is checked against
+    the state table before any of them is applied. Whatever goes wrong
+    with one request is reported in its result without stopping the rest.
+    """
+    person_id = get_person_id_for(email) if email else None
+    results = []
+    checked = []
+    seen = set()
+    for action_req in action_reqs:
+        manu_id = action_req.get(MANU_ID)
+        action = action_req.get(ACTION)
+        try:
+            if manu_id in seen:
+                raise ValueError(f'{manu_id} appears more than once in '
+                                 'this batch')
+            seen.add(manu_id)
+            func = check_action(manu_id, action, person_id=person_id,
+                                version=action_req.get(VERSION_ARG))
+            checked.append((len(results), func, action_req))
+            results.append(None)
+        except Exception as e:
+            results.append(make_action_result(
+                manu_id, action, error=str(e),
+                conflict=isinstance(e, VersionConflict)))
+    for result_pos, func, action_req in checked:
+        manu_id = action_req[MANU_ID]
+        action = action_req[ACTION]
+        try:
+            new_state = run_action(manu_id, action, func,
+                                   **(action_req.get(KWARGS) or {}))
+            results[result_pos] = make_action_result(manu_id, action,
+                                                     new_state=new_state)
+        except Exception as e:
+            results[result_pos] = make_action_result(
+                manu_id, action, error=str(e),
+                conflict=isinstance(e, VersionConflict))
+    return results
 
 
 ACTIONS = 'actions'
@@ -684,39 +1223,55 @@ def get_users_actions_for_manu(person_id: str, manu_id: str) -> list:
     """
     user_role = get_users_role_for_manu(person_id, manu_id)
     state = get_state(manu_id)
-    all_actions = STATE_TABLE.get(state)
-    user_actions = []
-    for action, action_dict in all_actions.items():
-        if user_role in action_dict.get(ROLES):
-            user_actions.append(action)
-    return user_actions
+    return fsm.get_actions(FSM, state, user_role)
 
 
+@record_context()
 def fetch_manuscripts(email: str) -> dict:
     """
-    Fetches manuscripts based on what the user is allowed to see
+    Fetches manuscripts based on what the user is allowed to see.
+    We only look at the manuscripts the visibility index says the user
+    can see, rather than walking every manuscript.
     """
-    manu_dict = fetch_dict()
     person_id = pqry.fetch_id_by_email(email)
     if not person_id:
         return {}
-    to_del = []
-    for manu_id in manu_dict:
+    manu_dict = {}
+    for manu_id in get_visible_manu_ids(person_id):
+        manu = lookup_record(manu_id)
+        if not manu:
+            continue
+        if get_unrendered(manu):
+            # Written before we stored HTML, and not yet migrated.
+            manu = rnd.add_html(manu, get_flds())
         actions = get_users_actions_for_manu(person_id, manu_id)
         if actions:
-            manu_dict[manu_id][ACTIONS] = actions
-        else:
-            to_del.append(manu_id)
-
-    for manu_id in to_del:
-        del manu_dict[manu_id]
+            manu[ACTIONS] = actions
+            manu_dict[manu_id] = manu
     return manu_dict
 
 
 def main():
     """
     Run this as a program to see the output formats!
+    With --migrate-history, it moves legacy manuscripts' history into the
+    log instead: run that once after deploying the history log.
+    With --render-markdown, it stores the HTML for manuscripts written
+    before we did that.
     """
+    parser = argparse.ArgumentParser(
+        description='The manuscripts data module.')
+    parser.add_argument('--migrate-history', action='store_true',
+                        help="move legacy manuscripts' history into the log")
+    parser.add_argument('--render-markdown', action='store_true',
+                        help='store the HTML of older Markdown fields')
+    args = parser.parse_args()
+    if args.migrate_history:
+        print(f'Migrated the history of {migrate_history()} manuscripts.')
+    if args.render_markdown:
+        print(f'Rendered {render_markdown()} manuscripts.')
+    if args.migrate_history or args.render_markdown:
+        return
     print("Interactive test of manuscripts data module.")
     print(f'{fetch_dict()=}')
 
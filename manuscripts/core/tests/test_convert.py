@@ -0,0 +1,115 @@
+import pytest
+
+import manuscripts.core.convert as cnv
+
+TEST_MANU_ID = 'some_manu_id'
+TEST_TEXT = 'Some submitted text.'
+TIMEOUT = 30
+
+
+@pytest.fixture(scope='function')
+def txt_file(tmp_path):
+    filepath = tmp_path / f'{TEST_MANU_ID}.{cnv.TXT}'
+    filepath.write_text(TEST_TEXT)
+    return str(filepath)
+
+
+def test_convert_txt(txt_file, tmp_path):
+    assert TEST_TEXT in cnv.convert(txt_file, str(tmp_path))
+
+
+def test_submit(txt_file, tmp_path):
+    converted = []
+    job_id = cnv.submit(TEST_MANU_ID, txt_file, str(tmp_path),
+                        on_done=converted.append)
+    job = cnv.wait(job_id, timeout=TIMEOUT)
+    assert job[cnv.STATUS] == cnv.DONE
+    assert job[cnv.MANU_ID] == TEST_MANU_ID
+    assert TEST_TEXT in converted[0]
+
+
+def test_submit_missing_file(tmp_path):
+    job_id = cnv.submit(TEST_MANU_ID, str(tmp_path / 'missing.txt'),
+                        str(tmp_path))
+    job = cnv.wait(job_id, timeout=TIMEOUT)
+    assert job[cnv.STATUS] == cnv.FAILED
+    assert job[cnv.ERROR]
+
+
+def test_submit_on_done_fails(txt_file, tmp_path):
+    def on_done(text):
+        raise ValueError('Could not save text')
+
+    job_id = cnv.submit(TEST_MANU_ID, txt_file, str(tmp_path),
+                        on_done=on_done)
+    assert cnv.wait(job_id, timeout=TIMEOUT)[cnv.STATUS] == cnv.FAILED
+
+
+def test_submit_busy(txt_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(cnv, 'MAX_PENDING', 0)
+    with pytest.raises(cnv.ConversionBusy):
+        cnv.submit(TEST_MANU_ID, txt_file, str(tmp_path))
+
+
+def test_fetch_status_bad_id():
+    with pytest.raises(ValueError):
+        cnv.fetch_status('not a job id')
+
+
+TEST_HASH = 'a' * 64
+TEST_KEY = f'{TEST_HASH}-{cnv.TXT}'
+IMAGE = 'image1.png'
+
+
+@pytest.fixture(scope='function')
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(cnv, 'CACHE_DIR', cache_dir)
+    return cache_dir
+
+
+def make_media_dir(path) -> str:
+    media = path / cnv.MEDIA
+    media.mkdir(parents=True)
+    (media / IMAGE).write_bytes(b'an image')
+    return str(path)
+
+
+def test_store_and_fetch_cached(cache_dir, tmp_path):
+    old_dir = make_media_dir(tmp_path / 'old')
+    text = f'![]({old_dir}/{cnv.MEDIA}/{IMAGE})'
+    cnv.store_cached(TEST_KEY, old_dir, text)
+    new_dir = str(tmp_path / 'new')
+    cached = cnv.fetch_cached(TEST_KEY, new_dir)
+    assert cached == f'![]({new_dir}/{cnv.MEDIA}/{IMAGE})'
+    assert (tmp_path / 'new' / cnv.MEDIA / IMAGE).exists()
+
+
+def test_fetch_cached_missing(cache_dir, tmp_path):
+    assert cnv.fetch_cached(TEST_KEY, str(tmp_path)) is None
+
+
+def test_get_cache_entry_bad_hash(cache_dir):
+    with pytest.raises(ValueError):
+        cnv.get_cache_entry('../../etc')
+
+
+def test_submit_cached(cache_dir, txt_file, tmp_path, monkeypatch):
+    cnv.store_cached(TEST_KEY, str(tmp_path), TEST_TEXT)
+    monkeypatch.setattr(cnv, '_start', None)  # must not convert
+    converted = []
+    job_id = cnv.submit(TEST_MANU_ID, txt_file, str(tmp_path),
+                        on_done=converted.append, content_hash=TEST_HASH)
+    assert cnv.fetch_status(job_id)[cnv.STATUS] == cnv.DONE
+    assert converted == [TEST_TEXT]
+
+
+def test_make_cache_key():
+    assert cnv.make_cache_key(TEST_HASH, 'dir/paper.TXT') == TEST_KEY
+
+
+def test_cache_keyed_on_ext(cache_dir, tmp_path):
+    html_key = cnv.make_cache_key(TEST_HASH, 'a.html')
+    cnv.store_cached(html_key, str(tmp_path), 'Converted from html')
+    txt_key = cnv.make_cache_key(TEST_HASH, 'b.txt')
+    assert cnv.fetch_cached(txt_key, str(tmp_path)) is None
@@ -0,0 +1,80 @@
+import pytest
+
+import manuscripts.core.fsm as fsm
+import manuscripts.core.states as mst
+from people.roles import AU, ED, RE, ROLES
+
+
+def handler(manu_id, **kwargs):
+    return mst.REJECTED
+
+
+TEST_TABLE = {
+    mst.SUBMITTED: {
+        action: {
+            fsm.FUNC: handler,
+            ROLES: [ED],
+        }
+        for action in mst.get_valid_actions()
+    },
+}
+TEST_TABLE[mst.SUBMITTED][mst.WITHDRAW][ROLES] = [AU]
+
+
+@pytest.fixture(scope='module')
+def test_fsm():
+    return fsm.compile_table(TEST_TABLE)
+
+
+def test_get_actions(test_fsm):
+    actions = fsm.get_actions(test_fsm, mst.SUBMITTED, ED)
+    assert mst.REJECT in actions
+    assert mst.WITHDRAW not in actions
+
+
+def test_get_actions_terminal_state(test_fsm):
+    assert fsm.get_actions(test_fsm, mst.REJECTED, ED) == []
+
+
+def test_get_actions_no_role(test_fsm):
+    assert fsm.get_actions(test_fsm, mst.SUBMITTED, None) == []
+
+
+def test_is_allowed(test_fsm):
+    assert fsm.is_allowed(test_fsm, mst.SUBMITTED, AU, mst.WITHDRAW)
+    assert not fsm.is_allowed(test_fsm, mst.SUBMITTED, RE, mst.WITHDRAW)
+    assert not fsm.is_allowed(test_fsm, mst.SUBMITTED, ED, 'bad action')
+
+
+def test_get_handler(test_fsm):
+    assert fsm.get_handler(test_fsm, mst.SUBMITTED, mst.REJECT) is handler
+    assert fsm.get_handler(test_fsm, mst.REJECTED, mst.REJECT) is None
+
+
+def test_compile_bad_state():
+    with pytest.raises(ValueError):
+        fsm.compile_table({'bad state': {}, **TEST_TABLE})
+
+
+def test_compile_bad_role():
+    bad_table = {mst.SUBMITTED: dict(TEST_TABLE[mst.SUBMITTED])}
+    bad_table[mst.SUBMITTED][mst.REJECT] = {
+        fsm.FUNC: handler,
+        ROLES: ['bad role'],
+    }
+    with pytest.raises(ValueError):
+        fsm.compile_table(bad_table)
+
+
+def test_compile_no_handler():
+    bad_table = {mst.SUBMITTED: dict(TEST_TABLE[mst.SUBMITTED])}
+    bad_table[mst.SUBMITTED][mst.REJECT] = {ROLES: [ED]}
+    with pytest.raises(ValueError):
+        fsm.compile_table(bad_table)
+
+
+def test_compile_unreachable_action():
+    bad_table = {mst.SUBMITTED: dict(TEST_TABLE[mst.SUBMITTED])}
+    del bad_table[mst.SUBMITTED][mst.REJECT]
+    with pytest.raises(ValueError):
+        fsm.compile_table(bad_table)
@@ -0,0 +1,60 @@
+import pytest
+
+import manuscripts.core.history as hist
+
+TEST_MANU_ID = 'not a real manuscript'
+TEST_ENTRY = {'action': 'reject', 'new_state': 'rejected'}
+TIMESTAMPS = [
+    '2024-01-01T00:00:00',
+    '2024-01-02T00:00:00',
+    '2024-01-03T00:00:00',
+]
+
+
+@pytest.fixture(scope='function')
+def temp_history():
+    for timestamp in TIMESTAMPS:
+        hist.append(TEST_MANU_ID, timestamp, TEST_ENTRY)
+    yield TEST_MANU_ID
+    hist.delete_for_manu(TEST_MANU_ID)
+
+
+def test_append():
+    rec_id = hist.append(TEST_MANU_ID, TIMESTAMPS[0], TEST_ENTRY)
+    assert hist.fetch_by_key(rec_id)[hist.ENTRY] == TEST_ENTRY
+    hist.delete_for_manu(TEST_MANU_ID)
+
+
+def test_count(temp_history):
+    assert hist.count(temp_history) == len(TIMESTAMPS)
+
+
+def test_count_after_rebuild(temp_history):
+    hist.build_index()
+    assert hist.count(temp_history) == len(TIMESTAMPS)
+
+
+def test_fetch_page(temp_history):
+    page = hist.fetch_page(temp_history, limit=2)
+    assert page[hist.TOTAL] == len(TIMESTAMPS)
+    assert list(page[hist.ENTRIES]) == [TIMESTAMPS[2], TIMESTAMPS[1]]
+
+
+def test_fetch_page_offset(temp_history):
+    page = hist.fetch_page(temp_history, offset=2, limit=2)
+    assert list(page[hist.ENTRIES]) == [TIMESTAMPS[0]]
+
+
+def test_fetch_page_bad_limit(temp_history):
+    with pytest.raises(ValueError):
+        hist.fetch_page(temp_history, limit=hist.MAX_PAGE_LEN + 1)
+
+
+def test_fetch_page_bad_offset(temp_history):
+    with pytest.raises(ValueError):
+        hist.fetch_page(temp_history, offset=-1)
+
+
+def test_delete_for_manu(temp_history):
+    hist.delete_for_manu(temp_history)
+    assert hist.count(temp_history) == 0
@@ -0,0 +1,107 @@
+import base64
+import os
+import zipfile
+from unittest.mock import patch
+
+import pytest
+import requests
+
+import manuscripts.core.pandoc_server as pds
+
+POST_PATH = 'requests.post'
+IMAGE_BYTES = b'not really a png'
+MARKDOWN = 'Some *text*\n\n![](media/image1.png)\n'
+
+
+class FakeResponse():
+    def __init__(self, body: dict, ok: bool = True):
+        self.body = body
+        self.ok = ok
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture(scope='function')
+def docx_file(tmp_path):
+    filepath = str(tmp_path / 'submission.docx')
+    with zipfile.ZipFile(filepath, 'w') as docx:
+        docx.writestr('word/document.xml', '<document/>')
+        docx.writestr('word/media/image1.png', IMAGE_BYTES)
+    return filepath
+
+
+def test_get_format():
+    assert pds.get_format('paper.docx') == 'docx'
+    assert pds.get_format('paper.MD') == 'markdown'
+    assert pds.get_format('paper.html') == 'html'
+
+
+def test_extract_docx_media(docx_file, tmp_path):
+    media_dir = str(tmp_path / 'out')
+    assert pds.extract_docx_media(docx_file, media_dir)
+    with open(os.path.join(media_dir, pds.MEDIA, 'image1.png'), 'rb') as f:
+        assert f.read() == IMAGE_BYTES
+
+
+@patch(POST_PATH, autospec=True,
+       return_value=FakeResponse({'output': MARKDOWN, 'base64': False}))
+def test_convert_docx(mock_post, docx_file, tmp_path):
+    media_dir = str(tmp_path / 'out')
+    output = pds.convert(docx_file, media_dir)
+    assert f'![]({media_dir}/media/image1.png)' in output
+    sent = mock_post.call_args.kwargs['json']
+    assert sent['from'] == 'docx'
+    with open(docx_file, 'rb') as f:
+        assert base64.b64decode(sent['text']) == f.read()
+
+
+@patch(POST_PATH, autospec=True,
+       return_value=FakeResponse({'error': 'bad doc'}, ok=False))
+def test_convert_server_error(mock_post, docx_file, tmp_path):
+    with pytest.raises(pds.PandocServerError):
+        pds.convert(docx_file, str(tmp_path))
+
+
+@patch(POST_PATH, autospec=True,
+       side_effect=requests.ConnectionError('refused'))
+def test_convert_unreachable(mock_post, docx_file, tmp_path):
+    with pytest.raises(pds.PandocServerError):
+        pds.convert(docx_file, str(tmp_path))
+
+
+def test_ensure_running_disabled(monkeypatch):
+    monkeypatch.setattr(pds, 'USE_SERVER', False)
+    assert not pds.ensure_running()
+
+
+@patch('manuscripts.core.pandoc_server.start', autospec=True,
+       side_effect=pds.PandocServerError('no pandoc'))
+@patch('manuscripts.core.pandoc_server.is_healthy', autospec=True,
+       return_value=False)
+def test_check_health_down(mock_is_healthy, mock_start):
+    pds.healthy.set()
+    pds.check_health()
+    assert not pds.healthy.is_set()
+
+
+@patch('manuscripts.core.pandoc_server.is_healthy', autospec=True,
+       return_value=True)
+def test_check_health_up(mock_is_healthy):
+    pds.healthy.clear()
+    pds.check_health()
+    assert pds.healthy.is_set()
+
+
+@patch('manuscripts.core.pandoc_server.Thread', autospec=True)
+def test_ensure_running_reads_flag(mock_thread, monkeypatch):
+    monkeypatch.setattr(pds, 'USE_SERVER', True)
+    monkeypatch.setattr(pds, 'monitor', None)
+    pds.healthy.clear()
+    assert not pds.ensure_running()
+    mock_thread.return_value.start.assert_called_once()
+    pds.healthy.set()
+    assert pds.ensure_running()
+    assert mock_thread.call_count == 1
+    pds.healthy.clear()
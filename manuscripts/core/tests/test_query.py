@@ -1,3 +1,5 @@
+import hashlib
+import io
 from copy import deepcopy
 
 from unittest.mock import patch
@@ -10,6 +12,7 @@ from manuscripts.core.query import (
     HISTORY,
 )
 import manuscripts.core.states as mst
+import people.roles as rls
 from people.tests.test_query import temp_person
 
 
@@ -30,6 +33,7 @@ FILE_DICT = {qry.MANU_FILE: FakeFileObj(good_file=True)}
 NO_FILE_DICT = {}
 BAD_FILE_DICT = {qry.MANU_FILE: FakeFileObj(good_file=False)}
 QUERY_PATH = 'manuscripts.core.query'
+ENQUEUE_PATH = 'journal_common.outbox.enqueue'
 
 
 def add_test_manuscript():
@@ -52,8 +56,25 @@ def temp_manu():
     qry.delete(ret)
 
 
+REFEREE_EMAIL = 'referee.only@utopia.com'
+
+
+@pytest.fixture(scope='function')
+def temp_referee():
+    """
+    A person who is only a referee: unlike `temp_person`, not an editor.
+    """
+    ret = qry.pqry.add({
+        qry.NAME: 'Only A. Referee',
+        qry.EMAIL: REFEREE_EMAIL,
+        rls.ROLES: [rls.RE],
+    })
+    yield ret
+    qry.pqry.delete(ret)
+
+
 @pytest.mark.skip('Waiting to complete new file submission procedure.')
-@patch(f'{QUERY_PATH}.convert_file',
+@patch('manuscripts.core.convert.convert',
        return_value='Text submitted',
        autospec=True)
 def test_handle_file_entry(mock_convert):
@@ -219,20 +240,20 @@ def test_update_history(temp_manu):
     assert len(history) == 2
 
 
-@patch(f'{QUERY_PATH}.send_mail', return_value=True, autospec=True)
-def test_notify_referee(mock_send_mail, temp_manu, temp_person):
+@patch(ENQUEUE_PATH, return_value=True, autospec=True)
+def test_notify_referee(mock_enqueue, temp_manu, temp_person):
     ret = qry.notify_referee(temp_manu, temp_person)
     assert ret
 
 
-@patch(f'{QUERY_PATH}.send_mail', return_value=True, autospec=True)
-def test_notify_referee_bad_person(mock_send_mail, temp_manu):
+@patch(ENQUEUE_PATH, return_value=True, autospec=True)
+def test_notify_referee_bad_person(mock_enqueue, temp_manu):
     with pytest.raises(ValueError):
         qry.notify_referee(temp_manu, 'bad person')
 
 
-@patch(f'{QUERY_PATH}.send_mail', return_value=True, autospec=True)
-def test_notify_referee_bad_manu(mock_send_mail, temp_person):
+@patch(ENQUEUE_PATH, return_value=True, autospec=True)
+def test_notify_referee_bad_manu(mock_enqueue, temp_person):
     with pytest.raises(ValueError):
         qry.notify_referee('bad manu', temp_person)
 
@@ -246,11 +267,9 @@ FAKE_FILE_NM = '/somerandomplace/test'
 @patch(f'{QUERY_PATH}.get_editor_email',
       return_value='fake@email',
       autospec=True)
-@patch(f'{QUERY_PATH}.send_mail', return_value=FAKE_FILE_NM, autospec=True)
-def test_notify_editor_w_file(mock_get_submission,
-                       mock_get_editor_email,
-                       mock_send_mail,
-                       temp_manu):
+@patch(ENQUEUE_PATH, return_value=FAKE_FILE_NM, autospec=True)
+def test_notify_editor_w_file(mock_enqueue, mock_get_editor_email,
+                              mock_get_submission, temp_manu):
     ret = qry.notify_editor(temp_manu)
     assert ret
 
@@ -261,11 +280,9 @@ def test_notify_editor_w_file(mock_get_submission,
 @patch(f'{QUERY_PATH}.get_editor_email',
       return_value='fake@email',
       autospec=True)
-@patch(f'{QUERY_PATH}.send_mail', return_value=FAKE_FILE_NM, autospec=True)
-def test_notify_editor_w_text(mock_get_submission,
-                       mock_get_editor_email,
-                       mock_send_mail,
-                       temp_manu):
+@patch(ENQUEUE_PATH, return_value=FAKE_FILE_NM, autospec=True)
+def test_notify_editor_w_text(mock_enqueue, mock_get_editor_email,
+                              mock_get_submission, temp_manu):
     ret = qry.notify_editor(temp_manu)
     assert ret
 
@@ -273,7 +290,377 @@ def test_notify_editor_w_text(mock_get_submission,
 @patch(f'{QUERY_PATH}.get_original_submission_filename',
        return_value=True,
        autospec=True)
-@patch(f'{QUERY_PATH}.send_mail', return_value=FAKE_FILE_NM, autospec=True)
-def test_notify_editor_bad_manu(mock_get_submission, mock_send_mail):
+@patch(ENQUEUE_PATH, return_value=FAKE_FILE_NM, autospec=True)
+def test_notify_editor_bad_manu(mock_enqueue, mock_get_submission):
     with pytest.raises(ValueError):
         qry.notify_editor('bad manu')
+
+
+@patch(f'{QUERY_PATH}.update_fld', autospec=True,
+       side_effect=qry.VersionConflict('Someone got there first'))
+def test_assign_referee_conflict_leaves_record(mock_update_fld, temp_manu):
+    with pytest.raises(qry.VersionConflict):
+        qry.assign_referee(temp_manu, referee='some referee')
+    assert 'some referee' not in qry.get_referees(temp_manu)
+
+
+def test_get_visible_manu_ids_author(temp_manu):
+    author_email = qry.TEST_MANU[qry.AUTHORS][0][qry.EMAIL]
+    author_id = qry.pqry.fetch_id_by_email(author_email)
+    assert temp_manu in qry.get_visible_manu_ids(author_id)
+
+
+def test_get_visible_manu_ids_not_involved(temp_manu, temp_referee):
+    assert temp_manu not in qry.get_visible_manu_ids(temp_referee)
+
+
+@patch('people.query.add_role', return_value='Fake ID', autospec=True)
+@patch(ENQUEUE_PATH, return_value=True, autospec=True)
+def test_get_visible_manu_ids_referee(mock_enqueue, mock_add_role,
+                                      temp_manu, temp_referee):
+    qry.build_visibility_index()
+    qry.assign_referee(temp_manu, referee=temp_referee)
+    assert temp_manu in qry.get_visible_manu_ids(temp_referee)
+    qry.remove_referee(temp_manu, referee=temp_referee)
+    assert temp_manu not in qry.get_visible_manu_ids(temp_referee)
+
+
+def test_get_visible_manu_ids_after_delete():
+    manu_id = add_test_manuscript()
+    qry.build_visibility_index()
+    author_email = qry.TEST_MANU[qry.AUTHORS][0][qry.EMAIL]
+    author_id = qry.pqry.fetch_id_by_email(author_email)
+    assert manu_id in qry.get_visible_manu_ids(author_id)
+    del_test_entry(manu_id)
+    assert manu_id not in qry.get_visible_manu_ids(author_id)
+
+
+def test_fetch_manuscripts_no_such_person():
+    assert qry.fetch_manuscripts('This email not in db!') == {}
+
+
+def test_record_context_saves_store_hits(temp_manu):
+    qry.reset_record_stats()
+    with qry.record_context():
+        qry.get_state(temp_manu)
+        qry.get_title(temp_manu)
+        qry.get_authors(temp_manu)
+    stats = qry.get_record_stats()
+    assert stats[qry.STORE_HITS] == 1
+    assert stats[qry.SAVED_HITS] == 2
+
+
+def test_record_context_forgets_on_write(temp_manu):
+    with qry.record_context():
+        assert qry.get_state(temp_manu) == mst.SUBMITTED
+        qry.update(temp_manu, {qry.STATE: mst.REJECTED})
+        assert qry.get_state(temp_manu) == mst.REJECTED
+
+
+def test_no_record_context_no_memo(temp_manu):
+    qry.reset_record_stats()
+    qry.get_state(temp_manu)
+    qry.get_title(temp_manu)
+    assert qry.get_record_stats()[qry.SAVED_HITS] == 0
+
+
+def test_apply_transition(temp_manu):
+    old_history = qry.fetch_by_id(temp_manu).get(HISTORY)
+    manu = qry.apply_transition(temp_manu, mst.TEST_ACTION, mst.REJECTED)
+    assert manu[qry.STATE] == mst.REJECTED
+    assert manu[qry.LAST_UPDATED] > qry.TEST_LAST_UPDATED
+    assert len(manu[HISTORY]) == len(old_history) + 1
+    entry = manu[HISTORY][manu[qry.LAST_UPDATED]]
+    assert entry[qry.ACTION] == mst.TEST_ACTION
+    assert entry[qry.NEW_STATE] == mst.REJECTED
+
+
+def test_apply_transition_bad_state(temp_manu):
+    with pytest.raises(ValueError):
+        qry.apply_transition(temp_manu, mst.TEST_ACTION, 'bad state')
+
+
+def test_apply_transition_bad_manu_id():
+    with pytest.raises(ValueError):
+        qry.apply_transition('bad id', mst.TEST_ACTION, mst.REJECTED)
+
+
+def test_update_bumps_version(temp_manu):
+    version = qry.get_version(temp_manu)
+    qry.update(temp_manu, {qry.TITLE: 'A new title'})
+    assert qry.get_version(temp_manu) == version + 1
+
+
+def test_update_expected_version(temp_manu):
+    version = qry.get_version(temp_manu)
+    qry.update(temp_manu, {qry.TITLE: 'A new title'},
+               expected_version=version)
+    assert qry.get_title(temp_manu) == 'A new title'
+
+
+def test_update_stale_version(temp_manu):
+    version = qry.get_version(temp_manu)
+    qry.update(temp_manu, {qry.TITLE: 'A new title'})
+    with pytest.raises(qry.VersionConflict):
+        qry.update_fld(temp_manu, qry.TITLE, 'Another title',
+                       expected_version=version)
+    assert qry.get_title(temp_manu) == 'A new title'
+
+
+def test_receive_action_stale_version(temp_manu):
+    version = qry.get_version(temp_manu)
+    qry.set_last_updated(temp_manu)
+    with pytest.raises(qry.VersionConflict):
+        qry.receive_action(temp_manu, mst.TEST_ACTION, version=version)
+    assert qry.get_state(temp_manu) == mst.TEST_STATE
+
+
+def test_receive_action_current_version(temp_manu):
+    version = qry.get_version(temp_manu)
+    new_state = qry.receive_action(temp_manu, mst.TEST_ACTION,
+                                   version=version)
+    assert qry.get_state(temp_manu) == new_state
+    assert qry.get_version(temp_manu) > version
+
+
+def test_history_in_log(temp_manu):
+    qry.update_history(temp_manu, mst.TEST_ACTION, mst.TEST_STATE)
+    manu = qry.fetch_by_id(temp_manu)
+    assert manu[qry.HISTORY_COUNT] == 2
+    assert qry.hist.count(temp_manu) == 2
+
+
+LEGACY_HISTORY_LEN = 15
+
+
+@qry.needs_manuscripts_cache
+def add_legacy_manuscript():
+    """
+    Stores a manuscript the way we did before the history log: all of its
+    history embedded, and no history count.
+    """
+    manu = deepcopy(qry.TEST_MANU)
+    manu[qry.STATE] = mst.TEST_STATE
+    manu[HISTORY] = {
+        f'2024-01-01T00:00:{i:02}': qry.make_history_entry(
+            mst.TEST_ACTION, mst.TEST_STATE)
+        for i in range(LEGACY_HISTORY_LEN)
+    }
+    return qry.get_cache(qry.COLLECT).add(manu)
+
+
+@pytest.fixture(scope='function')
+def legacy_manu():
+    qry.add_authors(deepcopy(qry.TEST_MANU[qry.AUTHORS]))
+    ret = add_legacy_manuscript()
+    qry.forget_record(ret)
+    qry.reindex_manu(ret)
+    yield ret
+    qry.delete(ret)
+
+
+def test_record_history_backfills_legacy(legacy_manu):
+    qry.update_history(legacy_manu, mst.TEST_ACTION, mst.TEST_STATE)
+    manu = qry.fetch_by_id(legacy_manu)
+    assert manu[qry.HISTORY_COUNT] == LEGACY_HISTORY_LEN + 1
+    assert len(manu[HISTORY]) == qry.HISTORY_SUMMARY_LEN
+    assert qry.hist.count(legacy_manu) == LEGACY_HISTORY_LEN + 1
+    page = qry.hist.fetch_page(legacy_manu, limit=qry.hist.MAX_PAGE_LEN)
+    assert '2024-01-01T00:00:00' in page[qry.hist.ENTRIES]
+
+
+def test_backfill_history_twice(legacy_manu):
+    manu = qry.fetch_by_key(legacy_manu)
+    qry.backfill_history(legacy_manu, manu)
+    qry.backfill_history(legacy_manu, manu)
+    assert qry.hist.count(legacy_manu) == LEGACY_HISTORY_LEN
+
+
+def test_fetch_history_legacy(legacy_manu):
+    author_email = qry.TEST_MANU[qry.AUTHORS][0][qry.EMAIL]
+    page = qry.fetch_history(legacy_manu, author_email)
+    assert page[qry.hist.TOTAL] == LEGACY_HISTORY_LEN
+
+
+def test_migrate_history(legacy_manu):
+    assert qry.migrate_history() >= 1
+    manu = qry.fetch_by_key(legacy_manu)
+    assert manu[qry.HISTORY_COUNT] == LEGACY_HISTORY_LEN
+    assert qry.hist.count(legacy_manu) == LEGACY_HISTORY_LEN
+
+
+def test_summarize_history():
+    history = {}
+    for i in range(qry.HISTORY_SUMMARY_LEN + 5):
+        history = qry.summarize_history(history, f'2024-01-01T00:00:{i:02}',
+                                        {})
+    assert len(history) == qry.HISTORY_SUMMARY_LEN
+    assert '2024-01-01T00:00:00' not in history
+
+
+def test_fetch_history(temp_manu):
+    author_email = qry.TEST_MANU[qry.AUTHORS][0][qry.EMAIL]
+    page = qry.fetch_history(temp_manu, author_email)
+    assert page[qry.hist.TOTAL] == 1
+
+
+def test_fetch_history_not_visible(temp_manu):
+    with pytest.raises(ValueError):
+        qry.fetch_history(temp_manu, 'This email not in db!')
+
+
+def test_receive_actions(temp_manu):
+    results = qry.receive_actions([
+        {qry.MANU_ID: temp_manu, qry.ACTION: mst.TEST_ACTION},
+        {qry.MANU_ID: 'bad id', qry.ACTION: mst.TEST_ACTION},
+    ])
+    assert len(results) == 2
+    assert results[0][qry.NEW_STATE] == mst.REJECTED
+    assert qry.get_state(temp_manu) == mst.REJECTED
+    assert results[1][qry.ERROR]
+    assert not results[1][qry.CONFLICT]
+
+
+def test_receive_actions_invalid_not_applied(temp_manu):
+    results = qry.receive_actions([
+        {qry.MANU_ID: temp_manu, qry.ACTION: mst.DONE},
+    ])
+    assert results[0][qry.ERROR]
+    assert qry.get_state(temp_manu) == mst.TEST_STATE
+
+
+def test_receive_actions_stale_version(temp_manu):
+    version = qry.get_version(temp_manu)
+    qry.set_last_updated(temp_manu)
+    results = qry.receive_actions([
+        {qry.MANU_ID: temp_manu, qry.ACTION: mst.TEST_ACTION,
+         qry.VERSION_ARG: version},
+    ])
+    assert results[0][qry.CONFLICT]
+
+
+def test_receive_actions_duplicate_manu(temp_manu):
+    results = qry.receive_actions([
+        {qry.MANU_ID: temp_manu, qry.ACTION: mst.TEST_ACTION},
+        {qry.MANU_ID: temp_manu, qry.ACTION: mst.TEST_ACTION},
+    ])
+    assert qry.NEW_STATE in results[0]
+    assert results[1][qry.ERROR]
+
+
+def test_receive_actions_bad_kwargs(temp_manu):
+    results = qry.receive_actions([
+        {qry.MANU_ID: temp_manu, qry.ACTION: mst.TEST_ACTION,
+         qry.KWARGS: {'manu_id': 'clash'}},
+        {qry.MANU_ID: 'bad id', qry.ACTION: mst.TEST_ACTION},
+    ])
+    assert results[0][qry.ERROR]
+    assert results[1][qry.ERROR]
+
+
+def test_receive_actions_bad_email():
+    with pytest.raises(ValueError):
+        qry.receive_actions([], 'This email not in db!')
+
+
+UPLOAD_BYTES = b'Some uploaded text.' * 1000
+UPLOAD_ID = 'some_manu_id'
+
+
+def test_ingest_file(tmp_path):
+    filepath, content_hash, size = qry.ingest_file(
+        io.BytesIO(UPLOAD_BYTES), 'paper.txt', str(tmp_path), UPLOAD_ID)
+    assert filepath == str(tmp_path / f'{UPLOAD_ID}.txt')
+    with open(filepath, 'rb') as f:
+        assert f.read() == UPLOAD_BYTES
+    assert content_hash == hashlib.sha256(UPLOAD_BYTES).hexdigest()
+    assert size == len(UPLOAD_BYTES)
+
+
+def test_ingest_file_too_large(tmp_path):
+    with pytest.raises(qry.UploadTooLarge):
+        qry.ingest_file(io.BytesIO(UPLOAD_BYTES), 'paper.txt',
+                        str(tmp_path), UPLOAD_ID,
+                        max_size=len(UPLOAD_BYTES) - 1)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_ingest_file_bad_ext(tmp_path):
+    with pytest.raises(ValueError):
+        qry.ingest_file(io.BytesIO(UPLOAD_BYTES), BAD_FILE_VAL,
+                        str(tmp_path), UPLOAD_ID)
+
+
+def test_check_upload_size():
+    qry.check_upload_size(None)
+    qry.check_upload_size(qry.MAX_UPLOAD_SIZE)
+    with pytest.raises(qry.UploadTooLarge):
+        qry.check_upload_size(qry.MAX_UPLOAD_SIZE + 1)
+
+
+def test_record_submission_file(temp_manu, tmp_path):
+    filepath = tmp_path / f'{temp_manu}.txt'
+    filepath.write_bytes(UPLOAD_BYTES)
+    content_hash = hashlib.sha256(UPLOAD_BYTES).hexdigest()
+    qry.record_submission_file(temp_manu, str(filepath), content_hash,
+                               len(UPLOAD_BYTES))
+    sub_file = qry.get_submission_file(temp_manu)
+    assert sub_file[qry.FILE_EXT] == 'txt'
+    assert sub_file[qry.FILE_SIZE] == len(UPLOAD_BYTES)
+    assert sub_file[qry.FILE_SHA256] == content_hash
+    with patch('glob.glob', autospec=True) as mock_glob:
+        assert qry.get_original_submission_filename(temp_manu) \
+            == str(filepath)
+        mock_glob.assert_not_called()
+
+
+def test_get_original_submission_filename_no_writes(temp_manu, tmp_path,
+                                                    monkeypatch):
+    monkeypatch.setattr(qry, 'UPLOAD_DIR', str(tmp_path))
+    assert qry.get_original_submission_filename(temp_manu) == ''
+    assert list(tmp_path.iterdir()) == []
+
+
+@patch('journal_common.render.to_html', autospec=True,
+       return_value='<p>Rendered</p>')
+def test_abstract_rendered_on_write(mock_to_html, temp_manu):
+    html_fld = qry.rnd.html_fld(qry.ABSTRACT)
+    qry.rnd.render_cache.clear()
+    qry.update(temp_manu, {qry.ABSTRACT: 'A *new* abstract'})
+    assert qry.fetch_by_key(temp_manu)[html_fld] == '<p>Rendered</p>'
+    mock_to_html.reset_mock()
+    qry.fetch_manuscripts(qry.TEST_MANU[qry.AUTHORS][0][qry.EMAIL])
+    mock_to_html.assert_not_called()
+
+
+def test_html_fld_not_writable(temp_manu):
+    html_fld = qry.rnd.html_fld(qry.ABSTRACT)
+    qry.update(temp_manu, {html_fld: '<script></script>'})
+    assert qry.fetch_by_key(temp_manu).get(html_fld) != '<script></script>'
+
+
+@patch(f'{QUERY_PATH}.migrate_history', autospec=True, return_value=3)
+def test_main_migrate_history(mock_migrate, monkeypatch, capsys):
+    monkeypatch.setattr('sys.argv', ['query.py', '--migrate-history'])
+    qry.main()
+    mock_migrate.assert_called_once()
+    assert '3 manuscripts' in capsys.readouterr().out
+
+
+@patch('journal_common.render.to_html', autospec=True,
+       return_value='<p>Rendered</p>')
+def test_fetch_manuscripts_renders_unmigrated(mock_to_html, legacy_manu):
+    html_fld = qry.rnd.html_fld(qry.ABSTRACT)
+    qry.rnd.render_cache.clear()
+    author_email = qry.TEST_MANU[qry.AUTHORS][0][qry.EMAIL]
+    manus = qry.fetch_manuscripts(author_email)
+    assert manus[legacy_manu][html_fld] == '<p>Rendered</p>'
+
+
+@patch('journal_common.render.to_html', autospec=True,
+       return_value='<p>Rendered</p>')
+def test_render_markdown(mock_to_html, legacy_manu):
+    html_fld = qry.rnd.html_fld(qry.ABSTRACT)
+    assert qry.render_markdown() >= 1
+    assert qry.fetch_by_key(legacy_manu)[html_fld] == '<p>Rendered</p>'
+    assert not qry.get_unrendered(qry.fetch_by_key(legacy_manu))
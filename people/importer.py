@@ -0,0 +1,206 @@
+"""
+Bulk import of people from CSV or JSON Lines.
+Rows are read one at a time and checked. Their emails are looked up a
+batch at a time, to find duplicates, and each new person is then added
+with its own write: our cache has no bulk insert. Each row gets a line in
+the report, which `import_people()` yields as it goes; `run_import()`
+keeps only counts and the first MAX_REPORTED rows that weren't added, so
+memory use depends on the batch size, not the file size. If the file
+can't be read past some row, the import stops there, keeping what was
+done before it.
+In CSV files, roles are given in one column, separated by semicolons.
+"""
+import argparse
+import csv
+import json
+import os
+
+import people.query as pqry
+import people.roles as rls
+from people.fields import (
+    EMAIL,
+    ROLES,
+    get_fld_names,
+)
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = [CSV, JSONL]
+ROLES_SEP = ';'
+
+DEF_BATCH_SIZE = 100
+MAX_REPORTED = int(os.getenv('IMPORT_MAX_REPORTED', 100))
+
+# Import result fields:
+COUNTS = 'counts'
+REPORT = 'report'
+TRUNCATED = 'truncated'
+
+# Report fields:
+ROW = 'row'
+STATUS = 'status'
+ID = 'id'
+ERROR = 'error'
+
+# Row statuses:
+ADDED = 'added'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+
+class ReadError(ValueError):
+    """
+    Raised when the file can't be read past some row.
+    """
+
+
+def get_format(filename: str) -> str:
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else None
+    if ext == 'json':
+        ext = JSONL
+    if ext not in FORMATS:
+        raise ValueError(f'Can only import these formats: {FORMATS}')
+    return ext
+
+
+def read_rows(stream, fmt: str):
+    """
+    Yields each row of a text stream: CSV rows as dicts, JSON Lines rows
+    as unparsed lines, so that a bad line only spoils its own row.
+    """
+    if fmt == CSV:
+        for row in csv.DictReader(stream):
+            if row.get(ROLES):
+                row[ROLES] = row[ROLES].split(ROLES_SEP)
+            yield row
+    elif fmt == JSONL:
+        for line in stream:
+            if line.strip():
+                yield line
+    else:
+        raise ValueError(f'Can only import these formats: {FORMATS}')
+
+
+def clean_row(row: dict) -> dict:
+    """
+    Keeps only the person fields we know about, and checks them.
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f'Not a person: {row}')
+    person = {}
+    for fld in get_fld_names():
+        val = row.get(fld)
+        if isinstance(val, str):
+            val = val.strip()
+        if val:
+            person[fld] = val
+    pqry.validate_person(person)
+    roles = person.get(ROLES, [])
+    if not isinstance(roles, list):
+        raise ValueError(f'Roles must be a list: {roles}')
+    person[ROLES] = [role.strip() for role in roles
+                     if isinstance(role, str) and role.strip()]
+    for role in person[ROLES]:
+        if not rls.is_valid(role):
+            raise ValueError(f'Invalid {role=}.')
+    return person
+
+
+def make_report(row_num: int, status: str, _id: str = None,
+                error: str = None) -> dict:
+    report = {ROW: row_num, STATUS: status}
+    if _id:
+        report[ID] = _id
+    if error:
+        report[ERROR] = error
+    return report
+
+
+def add_rows(batch: list):
+    """
+    `batch` is a list of (row number, person) pairs. All their emails are
+    looked up at once; people already there are reported as duplicates,
+    and the rest are added one at a time.
+    """
+    found = pqry.fetch_ids_by_emails([person.get(EMAIL)
+                                      for row_num, person in batch])
+    seen = set()
+    for row_num, person in batch:
+        email = pqry.normalize_email(person.get(EMAIL))
+        _id = found.get(person.get(EMAIL))
+        if _id or (email and email in seen):
+            yield make_report(row_num, DUPLICATE, _id=_id)
+            continue
+        try:
+            _id = pqry.add(person)
+        except ValueError as err:
+            yield make_report(row_num, INVALID, error=str(err))
+            continue
+        if email:
+            seen.add(email)
+        yield make_report(row_num, ADDED, _id=_id)
+
+
+def import_people(stream, fmt: str, batch_size: int = DEF_BATCH_SIZE):
+    """
+    Imports the people in a text stream, yielding a report for each row.
+    """
+    if batch_size < 1:
+        raise ValueError(f'Bad batch size: {batch_size}')
+    batch = []
+    row_num = 0
+    try:
+        for row_num, row in enumerate(read_rows(stream, fmt), start=1):
+            try:
+                batch.append((row_num, clean_row(row)))
+            except ValueError as err:
+                yield make_report(row_num, INVALID, error=str(err))
+            if len(batch) >= batch_size:
+                yield from add_rows(batch)
+                batch = []
+    except (csv.Error, UnicodeDecodeError) as err:
+        yield from add_rows(batch)
+        raise ReadError(f'Could not read row {row_num + 1}: {err}')
+    yield from add_rows(batch)
+
+
+def run_import(stream, fmt: str, batch_size: int = DEF_BATCH_SIZE) -> dict:
+    """
+    Runs a whole import, returning how many rows had each status, and the
+    reports for the first MAX_REPORTED rows that weren't added; TRUNCATED
+    says whether there were more. If we stop at an unreadable row, ERROR
+    says where and why.
+    """
+    result = {COUNTS: {ADDED: 0, DUPLICATE: 0, INVALID: 0},
+              REPORT: [],
+              TRUNCATED: False}
+    try:
+        for report in import_people(stream, fmt, batch_size=batch_size):
+            result[COUNTS][report[STATUS]] += 1
+            if report[STATUS] == ADDED:
+                continue
+            if len(result[REPORT]) < MAX_REPORTED:
+                result[REPORT].append(report)
+            else:
+                result[TRUNCATED] = True
+    except ReadError as err:
+        result[ERROR] = str(err)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Import people from a CSV or JSON Lines file.')
+    parser.add_argument('filename')
+    parser.add_argument('--batch-size', type=int, default=DEF_BATCH_SIZE)
+    args = parser.parse_args()
+    with open(args.filename, newline='') as stream:
+        for report in import_people(stream, get_format(args.filename),
+                                    batch_size=args.batch_size):
+            print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 This is our interface to journal people data.
 """
 from copy import deepcopy
+from threading import Lock, RLock
 
 from backendcore.common.constants import (
   OBJ_ID_NM,
@@ -10,11 +11,16 @@ from backendcore.common.constants import (
 from backendcore.data.caching import needs_cache, get_cache
 
 from journal_common.common import get_collect_name
+from journal_common.constants import MASTHEAD
+import journal_common.etags as etg
 
 import people.roles as rls
+import people.search as srch
 from people.fields import (  # noqa 401
+    AFFILIATION,
     BIO,
     NAME,
+    POSITION,
     ROLES,
     USER_ID,
 )
@@ -34,6 +40,176 @@ def needs_people_cache(fn):
                        no_id=False)
 
 
+# Indexes over the people cache.
+# They are built from the cache on first use, and `add`, `update`,
+# `add_role` and `delete` keep them current.
+# We use dicts as ordered sets, so people stay in cache order.
+# Emails are unique: the email index maps each normalized email to the
+# one person who has it.
+# The name index serves partial-name searches over names, affiliations
+# and positions.
+role_index = {}
+email_index = {}
+name_index = srch.new_index()
+indexed_people = {}
+index_built = False
+index_lock = Lock()
+
+
+INDEXED_ROLES = 'roles'
+INDEXED_EMAIL = 'email'
+
+# How much a search match on each field counts:
+SEARCH_WEIGHTS = {
+    NAME: 1.0,
+    AFFILIATION: 0.5,
+    POSITION: 0.5,
+}
+
+
+def normalize_email(email: str) -> str:
+    if not isinstance(email, str):
+        return None
+    return email.strip().casefold() or None
+
+
+def _unindex_person(_id: str):
+    indexed = indexed_people.pop(_id, {})
+    for role in indexed.get(INDEXED_ROLES, {}):
+        role_index.get(role, {}).pop(_id, None)
+    email = indexed.get(INDEXED_EMAIL)
+    if email and email_index.get(email) == _id:
+        del email_index[email]
+    srch.remove_doc(name_index, _id)
+
+
+def _index_person(_id: str, person: dict):
+    _unindex_person(_id)
+    roles = dict.fromkeys(person.get(ROLES) or [])
+    for role in roles:
+        role_index.setdefault(role, {})[_id] = None
+    email = normalize_email(person.get(EMAIL))
+    if email:
+        # If the stored data already has a duplicate, the first one wins.
+        email_index.setdefault(email, _id)
+    srch.add_doc(name_index, _id, [(person.get(fld), weight)
+                                   for fld, weight in SEARCH_WEIGHTS.items()])
+    indexed_people[_id] = {
+        INDEXED_ROLES: roles,
+        INDEXED_EMAIL: email,
+    }
+
+
+def build_indexes():
+    global index_built
+    people = fetch_dict()
+    with index_lock:
+        role_index.clear()
+        email_index.clear()
+        name_index.update(srch.new_index())
+        indexed_people.clear()
+        for _id, person in people.items():
+            _index_person(_id, person)
+        index_built = True
+
+
+# Bumped on every write to people, any of which may change someone's roles.
+# Caches of decisions that depend on roles keep the generation they were
+# made under, and stop trusting them once it moves on.
+roles_generation = 0
+roles_generation_lock = Lock()
+
+
+def get_roles_generation() -> int:
+    return roles_generation
+
+
+def after_person_write(_id: str):
+    global roles_generation
+    with roles_generation_lock:
+        roles_generation += 1
+    invalidate_masthead()
+    reindex_person(_id)
+
+
+def reindex_person(_id: str):
+    """
+    Called after any write to the person `_id`.
+    If the indexes haven't been built yet, there is nothing to maintain.
+    """
+    if not index_built:
+        return
+    person = fetch_by_key(_id)
+    with index_lock:
+        if person:
+            _index_person(_id, person)
+        else:
+            _unindex_person(_id)
+
+
+def fetch_id_by_normalized_email(email: str) -> str:
+    if not index_built:
+        build_indexes()
+    with index_lock:
+        return email_index.get(email)
+
+
+def fetch_ids_by_emails(emails: list) -> dict:
+    """
+    Resolves many emails at once: returns {email: id or None}.
+    """
+    if not index_built:
+        build_indexes()
+    with index_lock:
+        return {email: email_index.get(normalize_email(email))
+                for email in emails}
+
+
+# There is no unique index on email in the database, so a check and the
+# write that follows it must not interleave with another's. Hold this
+# lock across both, and the reindexing after, which is what the check
+# reads. It only serializes writers in this process: writes from other
+# processes can still race.
+email_lock = RLock()
+
+
+def check_email_unique(person: dict, _id: str = None):
+    """
+    Raises a ValueError if someone other than `_id` already has the
+    email in `person`. Call with `email_lock` held.
+    """
+    email = normalize_email(person.get(EMAIL))
+    if not email:
+        return
+    owner = fetch_id_by_normalized_email(email)
+    if owner and owner != _id:
+        raise ValueError(f'{person.get(EMAIL)} already belongs to {owner}.')
+
+
+def search(query: str, limit: int = srch.DEF_LIMIT) -> dict:
+    """
+    Finds people whose name, affiliation or position partially match
+    `query`. Returns a dict of people, best match first.
+    """
+    if not index_built:
+        build_indexes()
+    with index_lock:
+        ranked = srch.search(name_index, query, limit=limit)
+    matches = {}
+    for _id, score in ranked:
+        person = fetch_by_key(_id)
+        if person:
+            matches[_id] = person
+    return matches
+
+
+def fetch_ids_by_role(role: str) -> list:
+    if not index_built:
+        build_indexes()
+    with index_lock:
+        return list(role_index.get(role, {}))
+
+
 def person_to_masthead(person: dict) -> dict:
     mast_peep = {}
     mast_peep[NAME] = person.get(NAME, '')
@@ -80,18 +256,15 @@ def fetch_by_key(_id):
     return get_cache(COLLECT).fetch_by_key(_id)
 
 
-@needs_people_cache
 def fetch_by_email(email: str) -> dict:
     """
-    Email must be unique.
-    So the dictionary will have at most one person.
+    Email must be unique, so this is a single index lookup.
+    Case and surrounding whitespace don't matter.
     """
-    person = None
-    people = get_cache(COLLECT).fetch_by_fld_val(EMAIL, email)
-    for p in people.values():
-        person = p
-        break
-    return person
+    _id = fetch_id_by_normalized_email(normalize_email(email))
+    if not _id:
+        return None
+    return fetch_by_key(_id)
 
 
 def fetch_id_by_email(email: str) -> str:
@@ -124,7 +297,18 @@ def get_roles(_id: dict) -> list:
         raise ValueError(f'No such id: {_id}')
 
 
+def fetch_by_role(role: str) -> dict:
+    matches = {}
+    for _id in fetch_ids_by_role(role):
+        person = fetch_by_key(_id)
+        if person:
+            matches[_id] = person
+    return matches
+
+
 def fetch_all_or_some(name=None, role=None):
+    if role and not name:
+        return fetch_by_role(role)
     people = fetch_dict()
     if name or role:
         return select(people, name=name, role=role)
@@ -151,6 +335,49 @@ def is_referee(person):
     return has_role(person, rls.RE)
 
 
+# Role changes read a person's roles and write back just that one field.
+# The lock keeps two role changes from interleaving between the read and
+# the write.
+roles_lock = Lock()
+
+
+def _set_roles(_id: str, change) -> list:
+    with roles_lock:
+        person = fetch_by_key(_id)
+        if not person:
+            raise ValueError(f'No such id: {_id}')
+        roles = person.get(ROLES)
+        if not isinstance(roles, list):
+            roles = []
+        new_roles = change(roles)
+        if new_roles == roles:
+            return roles
+        get_cache(COLLECT).update_fld(_id, ROLES, new_roles, by_id=True)
+    after_person_write(_id)
+    return new_roles
+
+
+@needs_people_cache
+def add_role_to(_id: str, role: str) -> list:
+    """
+    Adds `role` to person `_id`, if they don't have it, with a single field
+    update. Returns their roles.
+    """
+    if not rls.is_valid(role):
+        raise ValueError(f'Invalid {role=}.')
+    return _set_roles(_id, lambda roles: (roles if role in roles
+                                          else roles + [role]))
+
+
+@needs_people_cache
+def remove_role_from(_id: str, role: str) -> list:
+    """
+    Takes `role` away from person `_id` with a single field update.
+    Returns their roles.
+    """
+    return _set_roles(_id, lambda roles: [rl for rl in roles if rl != role])
+
+
 def add_role(person, role):
     if not person or not role:
         raise ValueError(f'Failed to pass valid {person=} or {role=}.')
@@ -160,10 +387,7 @@ def add_role(person, role):
         raise ValueError(f'Invalid {role=}.')
     if has_role(person, role):
         return person
-    if not person[ROLES] or not isinstance(person[ROLES], list):
-        person[ROLES] = []
-    person[ROLES].append(role)
-    update(person[OBJ_ID_NM], person)
+    person[ROLES] = add_role_to(person[OBJ_ID_NM], role)
     return person
 
 
@@ -184,18 +408,67 @@ def possibly_new_person_add_role(email: str, role: str, name: str = None):
     return _id
 
 
+def _add_if_new(name: str, email: str, role: str) -> str:
+    """
+    Adds a person with `role`, unless someone has taken `email` since we
+    looked. Returns the id of whoever has it now.
+    """
+    with email_lock:
+        key = normalize_email(email)
+        _id = fetch_id_by_normalized_email(key) if key else None
+        if _id:
+            return _id
+        return add({
+            NAME: name,
+            EMAIL: email,
+            ROLES: [role],
+        })
+
+
+def ensure_people_with_role(entries: list, role: str) -> list:
+    """
+    `possibly_new_person_add_role()` for a list: `entries` is a list of
+    dicts with an email and a name. All the emails are looked up in one
+    pass; then anyone not there is added, and anyone there who lacks
+    `role` gets it, each with its own write, since our cache has no bulk
+    writes. People who already have the role cost no write at all.
+    Returns the people's ids, in the order given.
+    """
+    if not rls.is_valid(role):
+        raise ValueError(f'Invalid {role=}.')
+    emails = [entry.get(EMAIL) for entry in entries]
+    found = fetch_ids_by_emails(emails)
+    ids = []
+    done = {}
+    for entry, email in zip(entries, emails):
+        key = normalize_email(email)
+        if key and key in done:
+            ids.append(done[key])
+            continue
+        _id = found.get(email) or _add_if_new(entry.get(NAME), email, role)
+        person = fetch_by_key(_id)
+        if not has_role(person, role):
+            add_role(person, role)
+        if key:
+            done[key] = _id
+        ids.append(_id)
+    return ids
+
+
 def select(people: dict, name=None, role=None):
     """
     Select by name or role.
+    Role selection goes through the role index rather than a scan.
     """
     matches = {}
-    for code, person in people.items():
-        if name:
+    if name:
+        for code, person in people.items():
             if person.get(NAME) == name:
                 matches[person[OBJ_ID_NM]] = people[code]
-        elif role:
-            if has_role(person, role):
-                matches[person[OBJ_ID_NM]] = people[code]
+    elif role:
+        for _id in fetch_ids_by_role(role):
+            if _id in people:
+                matches[_id] = people[_id]
     return matches
 
 
@@ -206,18 +479,45 @@ def validate_person(person):
 
 
 def get_masthead():
-    people = fetch_dict()
     masthead = {}
     for role in rls.get_masthead_roles():
         descr = rls.get_descr(role)
-        masthead[descr] = []
-        for person in people.values():
-            if has_role(person, role):
-                mast_peep = person_to_masthead(person)
-                masthead[descr].append(mast_peep)
+        masthead[descr] = [person_to_masthead(person)
+                           for person in fetch_by_role(role).values()]
     return masthead
 
 
+# The masthead changes only when people do, so we keep it materialized,
+# already serialized, with its ETag. Any people write throws it away.
+# The generation count stops a build that raced a write from being kept.
+masthead_payload = None
+masthead_generation = 0
+masthead_lock = Lock()
+
+
+def invalidate_masthead():
+    global masthead_payload, masthead_generation
+    with masthead_lock:
+        masthead_payload = None
+        masthead_generation += 1
+
+
+def get_masthead_payload() -> tuple:
+    """
+    Returns the masthead endpoint's JSON bytes and their ETag.
+    """
+    global masthead_payload
+    with masthead_lock:
+        if masthead_payload:
+            return masthead_payload
+        generation = masthead_generation
+    payload = etg.serialize({MASTHEAD: get_masthead()})
+    with masthead_lock:
+        if generation == masthead_generation:
+            masthead_payload = payload
+    return payload
+
+
 def get_email(_id):
     person = fetch_by_key(_id)
     if person:
@@ -240,12 +540,18 @@ TEST_PERSON = {
 @needs_people_cache
 def add(person: dict):
     validate_person(person)
-    return get_cache(COLLECT).add(person)
+    with email_lock:
+        check_email_unique(person)
+        _id = get_cache(COLLECT).add(person)
+        after_person_write(_id)
+    return _id
 
 
 @needs_people_cache
 def delete(_id):
-    return get_cache(COLLECT).delete(_id, by_id=True)
+    ret = get_cache(COLLECT).delete(_id, by_id=True)
+    after_person_write(_id)
+    return ret
 
 
 @needs_people_cache
@@ -254,7 +560,11 @@ def update(_id, person: dict):
     validate_person(update_peep)
     if OBJ_ID_NM in update_peep:
         del update_peep[OBJ_ID_NM]
-    return get_cache(COLLECT).update(_id, update_peep, by_id=True)
+    with email_lock:
+        check_email_unique(update_peep, _id)
+        ret = get_cache(COLLECT).update(_id, update_peep, by_id=True)
+        after_person_write(_id)
+    return ret
 
 
 def main():
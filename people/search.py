@@ -0,0 +1,148 @@
+"""
+An in-memory search index for finding people by partial names.
+Text is split into accent- and case-insensitive words. A query word
+matches an indexed word if it is a prefix of it, or failing that if the
+two share enough trigrams, so typos still find people. Each indexed text
+carries a weight (names count for more than affiliations), and results
+come back best match first.
+"""
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+# Index parts:
+DOCS = 'docs'
+WORDS = 'words'
+VOCAB = 'vocab'
+TRIGRAMS = 'trigrams'
+
+PREFIX_SCORE = 1.0
+MIN_SIMILARITY = 0.3
+DEF_LIMIT = 10
+
+
+def new_index() -> dict:
+    return {
+        DOCS: {},      # doc id -> {word: weight}
+        WORDS: {},     # word -> {doc id: weight}
+        VOCAB: [],     # every indexed word, sorted, for prefix lookups
+        TRIGRAMS: {},  # trigram -> set of words containing it
+    }
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed
+                   if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(text: str) -> list:
+    if not isinstance(text, str):
+        return []
+    return re.findall(r'\w+', normalize(text))
+
+
+def trigrams(word: str) -> set:
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _add_word(index: dict, word: str):
+    insort(index[VOCAB], word)
+    for trigram in trigrams(word):
+        index[TRIGRAMS].setdefault(trigram, set()).add(word)
+
+
+def _remove_word(index: dict, word: str):
+    vocab = index[VOCAB]
+    pos = bisect_left(vocab, word)
+    if pos < len(vocab) and vocab[pos] == word:
+        del vocab[pos]
+    for trigram in trigrams(word):
+        words = index[TRIGRAMS].get(trigram, set())
+        words.discard(word)
+        if not words:
+            index[TRIGRAMS].pop(trigram, None)
+
+
+def remove_doc(index: dict, doc_id: str):
+    for word in index[DOCS].pop(doc_id, {}):
+        docs = index[WORDS].get(word, {})
+        docs.pop(doc_id, None)
+        if not docs:
+            del index[WORDS][word]
+            _remove_word(index, word)
+
+
+def add_doc(index: dict, doc_id: str, weighted_texts: list):
+    """
+    Indexes `doc_id` under a list of (text, weight) pairs, replacing
+    whatever it was indexed under before.
+    """
+    remove_doc(index, doc_id)
+    doc_words = {}
+    for text, weight in weighted_texts:
+        for word in tokenize(text):
+            doc_words[word] = max(weight, doc_words.get(word, 0))
+    for word, weight in doc_words.items():
+        if word not in index[WORDS]:
+            index[WORDS][word] = {}
+            _add_word(index, word)
+        index[WORDS][word][doc_id] = weight
+    index[DOCS][doc_id] = doc_words
+
+
+def _prefix_matches(index: dict, prefix: str) -> list:
+    vocab = index[VOCAB]
+    matches = []
+    pos = bisect_left(vocab, prefix)
+    while pos < len(vocab) and vocab[pos].startswith(prefix):
+        matches.append(vocab[pos])
+        pos += 1
+    return matches
+
+
+def _fuzzy_matches(index: dict, word: str) -> dict:
+    """
+    Returns {indexed word: trigram similarity} for close enough words.
+    """
+    word_trigrams = trigrams(word)
+    shared = {}
+    for trigram in word_trigrams:
+        for candidate in index[TRIGRAMS].get(trigram, ()):
+            shared[candidate] = shared.get(candidate, 0) + 1
+    matches = {}
+    for candidate, count in shared.items():
+        union = len(word_trigrams) + len(trigrams(candidate)) - count
+        similarity = count / union
+        if similarity >= MIN_SIMILARITY:
+            matches[candidate] = similarity
+    return matches
+
+
+def _score_word(index: dict, word: str) -> dict:
+    """
+    Returns {doc id: score} for one query word. Prefix matches always beat
+    fuzzy ones, and a whole-word match beats a shorter prefix.
+    """
+    word_scores = {}
+    matches = _fuzzy_matches(index, word)
+    for candidate in _prefix_matches(index, word):
+        matches[candidate] = PREFIX_SCORE + len(word) / len(candidate)
+    for candidate, score in matches.items():
+        for doc_id, weight in index[WORDS][candidate].items():
+            word_scores[doc_id] = max(weight * score,
+                                      word_scores.get(doc_id, 0))
+    return word_scores
+
+
+def search(index: dict, query: str, limit: int = DEF_LIMIT) -> list:
+    """
+    Returns up to `limit` (doc id, score) pairs, best first.
+    """
+    scores = {}
+    for word in tokenize(query):
+        for doc_id, score in _score_word(index, word).items():
+            scores[doc_id] = scores.get(doc_id, 0) + score
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
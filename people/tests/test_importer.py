@@ -0,0 +1,122 @@
+import io
+
+import pytest
+
+import people.importer as pimp
+import people.query as pqry
+import people.roles as rls
+
+NEW_EMAIL = 'imported@utopia.com'
+OTHER_EMAIL = 'also.imported@utopia.com'
+
+TEST_CSV = (
+    'name,email,roles,affiliation\n'
+    f'Imported Person,{NEW_EMAIL},{rls.ED};{rls.RE},NYU\n'
+    f'Imported Again,{NEW_EMAIL.upper()},,\n'
+    f',{OTHER_EMAIL},,\n'
+    f'Bad Roles,{OTHER_EMAIL},Not a role,\n'
+)
+
+TEST_JSONL = (
+    f'{{"name": "Imported Person", "email": "{NEW_EMAIL}"}}\n'
+    '\n'
+    'this is not json\n'
+    f'{{"name": "Also Imported", "email": "{OTHER_EMAIL}"}}\n'
+)
+
+
+def unreadable_csv():
+    yield 'name,email\n'
+    yield f'Imported Person,{NEW_EMAIL}\n'
+    raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+
+def cleanup(reports):
+    for report in reports:
+        if report[pimp.STATUS] == pimp.ADDED:
+            pqry.delete(report[pimp.ID])
+
+
+def test_get_format():
+    assert pimp.get_format('people.csv') == pimp.CSV
+    assert pimp.get_format('people.JSONL') == pimp.JSONL
+    assert pimp.get_format('people.json') == pimp.JSONL
+
+
+def test_get_format_bad():
+    with pytest.raises(ValueError):
+        pimp.get_format('people.docx')
+
+
+def test_clean_row_splits_fields():
+    person = pimp.clean_row({pqry.NAME: ' Someone ', 'not a field': 1})
+    assert person == {pqry.NAME: 'Someone', pqry.ROLES: []}
+
+
+def test_clean_row_no_name():
+    with pytest.raises(ValueError):
+        pimp.clean_row({pqry.EMAIL: NEW_EMAIL})
+
+
+def test_import_csv():
+    reports = list(pimp.import_people(io.StringIO(TEST_CSV), pimp.CSV,
+                                      batch_size=1))
+    cleanup(reports)
+    assert [report[pimp.STATUS] for report in reports] == [
+        pimp.ADDED, pimp.DUPLICATE, pimp.INVALID, pimp.INVALID]
+    assert [report[pimp.ROW] for report in reports] == [1, 2, 3, 4]
+
+
+def test_import_csv_roles():
+    reports = list(pimp.import_people(io.StringIO(TEST_CSV), pimp.CSV))
+    added = pqry.fetch_by_key(reports[0][pimp.ID])
+    cleanup(reports)
+    assert added[pqry.ROLES] == [rls.ED, rls.RE]
+
+
+def test_import_csv_same_batch_dup():
+    reports = list(pimp.import_people(io.StringIO(TEST_CSV), pimp.CSV,
+                                      batch_size=10))
+    cleanup(reports)
+    assert reports[1][pimp.STATUS] == pimp.DUPLICATE
+
+
+def test_import_jsonl():
+    reports = list(pimp.import_people(io.StringIO(TEST_JSONL), pimp.JSONL))
+    cleanup(reports)
+    statuses = {report[pimp.ROW]: report[pimp.STATUS] for report in reports}
+    assert statuses == {1: pimp.ADDED, 2: pimp.INVALID, 3: pimp.ADDED}
+
+
+def test_import_bad_batch_size():
+    with pytest.raises(ValueError):
+        list(pimp.import_people(io.StringIO(TEST_CSV), pimp.CSV,
+                                batch_size=0))
+
+
+def test_import_stops_at_unreadable_row():
+    with pytest.raises(pimp.ReadError):
+        cleanup(pimp.import_people(unreadable_csv(), pimp.CSV))
+
+
+def test_run_import_keeps_counts():
+    result = pimp.run_import(unreadable_csv(), pimp.CSV)
+    pqry.delete(pqry.fetch_id_by_email(NEW_EMAIL))
+    assert result[pimp.COUNTS][pimp.ADDED] == 1
+    assert result[pimp.REPORT] == []
+    assert 'row 2' in result[pimp.ERROR]
+
+
+def test_run_import_report_capped(monkeypatch):
+    monkeypatch.setattr(pimp, 'MAX_REPORTED', 1)
+    result = pimp.run_import(io.StringIO(TEST_CSV), pimp.CSV)
+    pqry.delete(pqry.fetch_id_by_email(NEW_EMAIL))
+    assert result[pimp.COUNTS] == {pimp.ADDED: 1, pimp.DUPLICATE: 1,
+                                   pimp.INVALID: 2}
+    assert [report[pimp.ROW] for report in result[pimp.REPORT]] == [2]
+    assert result[pimp.TRUNCATED]
+
+
+def test_run_import_bad_batch_size():
+    with pytest.raises(ValueError):
+        pimp.run_import(io.StringIO(TEST_CSV), pimp.CSV, batch_size=0)
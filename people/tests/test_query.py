@@ -1,4 +1,7 @@
+import json
+
 from copy import deepcopy
+from threading import Barrier, Thread
 
 from unittest.mock import patch
 
@@ -77,8 +80,7 @@ def test_fetch_by_key_not_there():
 
 
 def test_add():
-    qry.add(get_person())
-    obj_id = qry.fetch_list()[0].get(qry.OBJ_ID_NM)
+    obj_id = qry.add(get_person())
     assert qry.fetch_by_key(obj_id) is not None
     del_test_item(obj_id)
 
@@ -191,7 +193,8 @@ def test_possibly_new_person_add_role_new_person():
         NEW_ROLE,
         get_person().get(qry.NAME)
     )
-    assert qry.fetch_by_key(new_person).get(qry.NAME) == get_person().get(qry.NAME)
+    assert (qry.fetch_by_key(new_person).get(qry.NAME)
+            == get_person().get(qry.NAME))
     assert qry.has_role(qry.fetch_by_key(new_person), NEW_ROLE)
     del_test_item(new_person)
 
@@ -232,3 +235,200 @@ def test_get_roles(temp_person):
 def test_get_roles_bad_person():
     with pytest.raises(ValueError):
         qry.get_roles('This email not in db!')
+
+
+def test_fetch_ids_by_role(temp_person):
+    assert temp_person in qry.fetch_ids_by_role(rls.TEST_ROLE)
+
+
+def test_fetch_ids_by_role_after_add_role(temp_person):
+    qry.build_indexes()
+    assert temp_person not in qry.fetch_ids_by_role(rls.RE)
+    qry.add_role(qry.fetch_by_key(temp_person), rls.RE)
+    assert temp_person in qry.fetch_ids_by_role(rls.RE)
+
+
+def test_fetch_ids_by_role_after_delete(new_person):
+    qry.build_indexes()
+    qry.delete(new_person)
+    assert new_person not in qry.fetch_ids_by_role(rls.TEST_ROLE)
+
+
+def test_fetch_by_role(temp_person):
+    people = qry.fetch_by_role(rls.TEST_ROLE)
+    assert temp_person in people
+    assert qry.has_role(people[temp_person], rls.TEST_ROLE)
+
+
+def test_fetch_all_or_some_role(temp_person):
+    people = qry.fetch_all_or_some(role=rls.TEST_ROLE)
+    assert temp_person in people
+
+
+def test_get_masthead_has_person(temp_person):
+    masthead = qry.get_masthead()
+    descr = rls.get_descr(rls.TEST_ROLE)
+    name = qry.TEST_PERSON[qry.NAME]
+    assert name in [peep[qry.NAME] for peep in masthead[descr]]
+
+
+def test_normalize_email():
+    assert (qry.normalize_email('  Some.One@Example.COM ')
+            == 'some.one@example.com')
+
+
+def test_normalize_email_not_str():
+    assert qry.normalize_email(None) is None
+
+
+def test_fetch_by_email_case_insensitive(temp_person):
+    ret = qry.fetch_by_email(f' {qry.TEST_EMAIL.upper()} ')
+    assert ret[qry.OBJ_ID_NM] == temp_person
+
+
+def test_add_duplicate_email(temp_person):
+    person = get_person()
+    person[qry.EMAIL] = qry.TEST_EMAIL.upper()
+    with pytest.raises(ValueError):
+        qry.add(person)
+
+
+def test_update_duplicate_email(temp_person):
+    other = get_person()
+    other[qry.EMAIL] = 'someone.else@utopia.com'
+    other_id = qry.add(other)
+    other[qry.EMAIL] = qry.TEST_EMAIL
+    with pytest.raises(ValueError):
+        qry.update(other_id, other)
+    del_test_item(other_id)
+
+
+def test_update_same_email(temp_person):
+    person = qry.fetch_by_key(temp_person)
+    qry.update(temp_person, person)
+    assert qry.fetch_id_by_email(qry.TEST_EMAIL) == temp_person
+
+
+def test_get_masthead_payload(temp_person):
+    data, etag = qry.get_masthead_payload()
+    assert isinstance(data, bytes)
+    assert qry.MASTHEAD in json.loads(data)
+    assert qry.get_masthead_payload() == (data, etag)
+
+
+def test_get_masthead_payload_invalidated_by_write(temp_person):
+    data, etag = qry.get_masthead_payload()
+    qry.update(temp_person, {qry.NAME: 'A new masthead name'})
+    new_data, new_etag = qry.get_masthead_payload()
+    assert new_etag != etag
+    assert b'A new masthead name' in new_data
+
+
+def test_search(temp_person):
+    people = qry.search('callah magnif')
+    assert temp_person in people
+
+
+def test_search_after_update(temp_person):
+    qry.update(temp_person, {qry.NAME: 'Zebulon Pike'})
+    assert temp_person in qry.search('zebu')
+    assert temp_person not in qry.search('magnifique')
+
+
+def test_search_limit(temp_person):
+    assert len(qry.search('callahan', limit=1)) <= 1
+
+
+def test_fetch_ids_by_emails(temp_person):
+    found = qry.fetch_ids_by_emails([qry.TEST_EMAIL, 'not@there.com'])
+    assert found[qry.TEST_EMAIL] == temp_person
+    assert found['not@there.com'] is None
+
+
+def test_ensure_people_with_role(temp_person):
+    NEW_EMAIL = 'new.author@utopia.com'
+    ids = qry.ensure_people_with_role([
+        {qry.EMAIL: qry.TEST_EMAIL, qry.NAME: 'Ignored'},
+        {qry.EMAIL: NEW_EMAIL, qry.NAME: 'New Author'},
+        {qry.EMAIL: NEW_EMAIL.upper(), qry.NAME: 'New Author'},
+    ], rls.AU)
+    assert ids[0] == temp_person
+    assert ids[1] == ids[2]
+    assert qry.has_role(qry.fetch_by_key(temp_person), rls.AU)
+    assert qry.has_role(qry.fetch_by_key(ids[1]), rls.AU)
+    del_test_item(ids[1])
+
+
+@patch('people.query.fetch_ids_by_emails', autospec=True, return_value={})
+def test_ensure_people_with_role_added_since(mock_fetch_ids, temp_person):
+    """
+    Someone added the person after we looked them up: we must not add
+    them again.
+    """
+    ids = qry.ensure_people_with_role([{qry.EMAIL: qry.TEST_EMAIL}], rls.AU)
+    assert ids == [temp_person]
+
+
+def test_add_same_email_concurrently():
+    NUM_WRITERS = 4
+    barrier = Barrier(NUM_WRITERS)
+    ids = []
+    errors = []
+
+    def add_one():
+        barrier.wait()
+        try:
+            ids.append(qry.add(get_person()))
+        except ValueError as err:
+            errors.append(err)
+
+    writers = [Thread(target=add_one) for _ in range(NUM_WRITERS)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    for _id in ids:
+        del_test_item(_id)
+    assert len(ids) == 1
+    assert len(errors) == NUM_WRITERS - 1
+
+
+def test_ensure_people_with_role_bad_role():
+    with pytest.raises(ValueError):
+        qry.ensure_people_with_role([{qry.EMAIL: qry.TEST_EMAIL}], 'Bad role!')
+
+
+def test_add_role_to(temp_person):
+    roles = qry.add_role_to(temp_person, rls.RE)
+    assert rls.RE in roles
+    assert qry.get_roles(temp_person) == roles
+    assert temp_person in qry.fetch_ids_by_role(rls.RE)
+
+
+def test_add_role_to_bumps_roles_generation(temp_person):
+    generation = qry.get_roles_generation()
+    qry.add_role_to(temp_person, rls.RE)
+    assert qry.get_roles_generation() > generation
+
+
+def test_add_role_to_twice(temp_person):
+    qry.add_role_to(temp_person, rls.RE)
+    roles = qry.add_role_to(temp_person, rls.RE)
+    assert roles.count(rls.RE) == 1
+
+
+def test_add_role_to_bad_role(temp_person):
+    with pytest.raises(ValueError):
+        qry.add_role_to(temp_person, 'Bad role!')
+
+
+def test_add_role_to_bad_person():
+    with pytest.raises(ValueError):
+        qry.add_role_to('not an existing code', rls.RE)
+
+
+def test_remove_role_from(temp_person):
+    roles = qry.remove_role_from(temp_person, rls.TEST_ROLE)
+    assert rls.TEST_ROLE not in roles
+    assert rls.TEST_ROLE not in qry.get_roles(temp_person)
+    assert temp_person not in qry.fetch_ids_by_role(rls.TEST_ROLE)
@@ -0,0 +1,67 @@
+import pytest
+
+import people.search as srch
+
+NAME_WEIGHT = 1.0
+OTHER_WEIGHT = 0.5
+
+
+@pytest.fixture(scope='function')
+def test_index():
+    index = srch.new_index()
+    srch.add_doc(index, 'callahan', [('Callahan le Magnifique', NAME_WEIGHT),
+                                     ('NYU', OTHER_WEIGHT)])
+    srch.add_doc(index, 'calvin', [('Calvin Coolidge', NAME_WEIGHT)])
+    srch.add_doc(index, 'elen', [('Élen Smith', NAME_WEIGHT),
+                                 ('Callahan Institute', OTHER_WEIGHT)])
+    return index
+
+
+def ids(results):
+    return [doc_id for doc_id, score in results]
+
+
+def test_tokenize():
+    assert srch.tokenize('Élen  SMITH-Jones') == ['elen', 'smith', 'jones']
+
+
+def test_tokenize_not_str():
+    assert srch.tokenize(None) == []
+
+
+def test_search_prefix(test_index):
+    assert ids(srch.search(test_index, 'cal')) == ['calvin', 'callahan',
+                                                   'elen']
+
+
+def test_search_name_beats_affiliation(test_index):
+    results = ids(srch.search(test_index, 'callahan'))
+    assert results.index('callahan') < results.index('elen')
+
+
+def test_search_accents(test_index):
+    assert ids(srch.search(test_index, 'elen')) == ['elen']
+
+
+def test_search_typo(test_index):
+    assert 'callahan' in ids(srch.search(test_index, 'calahan'))
+
+
+def test_search_limit(test_index):
+    assert len(srch.search(test_index, 'cal', limit=1)) == 1
+
+
+def test_search_no_match(test_index):
+    assert srch.search(test_index, 'zzzz') == []
+
+
+def test_add_doc_replaces(test_index):
+    srch.add_doc(test_index, 'calvin', [('Grace Hopper', NAME_WEIGHT)])
+    assert 'calvin' not in ids(srch.search(test_index, 'coolidge'))
+    assert ids(srch.search(test_index, 'hopper')) == ['calvin']
+
+
+def test_remove_doc(test_index):
+    srch.remove_doc(test_index, 'calvin')
+    assert 'calvin' not in ids(srch.search(test_index, 'cal'))
+    assert 'coolidge' not in test_index[srch.VOCAB]
@@ -2,18 +2,25 @@
 This is our interface to our us text data.
 We never expect our users to add or delete texts,
 so we make no provisions for that.
+Reads can be served from serialized payloads kept here, which every write
+to a text invalidates.
 """
+from threading import Lock
+
 import backendcore.common.time_fmts as tfmt
 
 from backendcore.data.caching import needs_cache, get_cache
 
 from journal_common.common import get_collect_name
+import journal_common.etags as etg
+import journal_common.render as rnd
 
 from text.fields import (
     EDITOR,
     LAST_EDIT,
     TEXT,
     TITLE,
+    get_flds,
 )
 
 DB = 'journalDB'
@@ -65,14 +72,62 @@ TEST_TEXT = {
 }
 
 
+# Texts are read far more than they are written, so we keep each one
+# serialized, with its ETag. Every write to a title bumps its version, and
+# a payload built from an older version is never kept.
+text_payloads = {}  # title -> (version, (bytes, etag))
+text_versions = {}  # title -> version
+payloads_lock = Lock()
+
+
+def invalidate_text(title):
+    with payloads_lock:
+        text_payloads.pop(title, None)
+        text_versions[title] = text_versions.get(title, 0) + 1
+
+
+def make_text_etag(text: dict, data: bytes) -> str:
+    """
+    A text's ETag is its last edit date plus a hash of its content.
+    """
+    content_hash = etg.make_etag(data)
+    last_edit = text.get(LAST_EDIT)
+    return f'{last_edit}-{content_hash}' if last_edit else content_hash
+
+
+def get_text_payload(title) -> tuple:
+    """
+    Returns the text `title`, with its Markdown rendered, as JSON bytes,
+    with its ETag.
+    """
+    with payloads_lock:
+        version = text_versions.get(title, 0)
+        cached = text_payloads.get(title)
+        if cached and cached[0] == version:
+            return cached[1]
+    text = fetch_by_key(title)
+    if not text:
+        raise ValueError(f'No such text: {title}')
+    data = etg.to_json_bytes(rnd.add_html(text, get_flds()))
+    payload = (data, make_text_etag(text, data))
+    with payloads_lock:
+        if text_versions.get(title, 0) == version:
+            text_payloads[title] = (version, payload)
+    return payload
+
+
 @needs_text_cache
 def add(text_dict):
-    return get_cache(CACHE_NM).add(text_dict)
+    ret = get_cache(CACHE_NM).add(text_dict)
+    invalidate_text(text_dict.get(TITLE))
+    return ret
 
 
 @needs_text_cache
 def delete(title):
-    return get_cache(CACHE_NM).delete(title)
+    ret = get_cache(CACHE_NM).delete(title)
+    invalidate_text(title)
+    return ret
 
 
 @needs_text_cache
@@ -81,7 +136,9 @@ def update(title, text, editor):
     update_dict[TEXT] = text
     update_dict[LAST_EDIT] = str(tfmt.today())
     update_dict[EDITOR] = editor
-    return get_cache(CACHE_NM).update(title, update_dict)
+    ret = get_cache(CACHE_NM).update(title, update_dict)
+    invalidate_text(title)
+    return ret
 
 
 @needs_text_cache
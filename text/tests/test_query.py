@@ -1,3 +1,4 @@
+import json
 from copy import deepcopy
 
 import pytest
@@ -46,3 +47,31 @@ def test_update_text_bad_title(temp_text):
     NEW_TEXT = 'Some new text'
     with pytest.raises(ValueError):
         qry.update('Not an existing title', NEW_TEXT, NEW_ED)
+
+
+def test_get_text_payload(temp_text):
+    data, etag = qry.get_text_payload(qry.TEST_TITLE)
+    text = json.loads(data)
+    assert text[qry.TEXT] == qry.TEST_TEXT[qry.TEXT]
+    assert qry.TEST_TEXT[qry.TEXT] in text[qry.rnd.html_fld(qry.TEXT)]
+    assert qry.get_text_payload(qry.TEST_TITLE) == (data, etag)
+
+
+def test_get_text_payload_after_update(temp_text):
+    data, etag = qry.get_text_payload(qry.TEST_TITLE)
+    qry.update(qry.TEST_TITLE, NEW_TEXT, NEW_ED)
+    new_data, new_etag = qry.get_text_payload(qry.TEST_TITLE)
+    assert json.loads(new_data)[qry.TEXT] == NEW_TEXT
+    assert new_etag != etag
+
+
+def test_get_text_payload_bad_title():
+    with pytest.raises(ValueError):
+        qry.get_text_payload('Not an existing title')
+
+
+def test_make_text_etag():
+    data = b'{}'
+    etag = qry.make_text_etag({qry.LAST_EDIT: '2024-01-01'}, data)
+    assert etag.startswith('2024-01-01-')
+    assert qry.make_text_etag({}, data) == qry.etg.make_etag(data)